@@ -2,12 +2,20 @@
 # A simplified architecture using 4 tools instead of 73
 # The LLM discovers services, learns schemas, and generates SQL dynamically
 
+import io
 import os
+import atexit
 import re
 import sys
 import json
-from textwrap import dedent
-from typing import Any, Dict, Optional, List, Tuple
+import logging
+import functools
+import operator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, List, Set, Tuple
 
 # Fix Windows console encoding for emojis and markdown
 if sys.platform == "win32":
@@ -17,33 +25,55 @@ if sys.platform == "win32":
         kernel32 = ctypes.windll.kernel32
         kernel32.SetConsoleOutputCP(65001)  # UTF-8 output
         kernel32.SetConsoleCP(65001)       # UTF-8 input
-        
-        # Also configure Python's stdout/stderr encoding
-        import io
-        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
     except:
         pass  # Fallback to default encoding
 
+
+def _configure_std_streams() -> None:
+    """
+    Configure Python's stdout/stderr once so unencodable characters are
+    replaced instead of raising UnicodeEncodeError on every print.
+    """
+    for name in ("stdout", "stderr"):
+        stream = getattr(sys, name)
+        try:
+            stream.reconfigure(encoding="utf-8", errors="replace")
+        except AttributeError:
+            # Stream replaced by something without reconfigure(); wrap it if possible
+            try:
+                setattr(sys, name, io.TextIOWrapper(
+                    stream.buffer, encoding="utf-8", errors="replace", line_buffering=True
+                ))
+            except Exception:
+                pass
+        except Exception:
+            pass  # Fallback to default encoding
+
+
+_configure_std_streams()
+
 from dotenv import load_dotenv
-from mapepire_python import connect
 from pep249 import QueryParameters
 
+# Heavy dependencies are imported where first needed to keep startup fast:
+# mapepire_python in _open_connection(), the OpenRouter model adapter in
+# build_agent() and rich in _get_console().
 from agno.agent import Agent, RunEvent, RunOutputEvent
-from agno.models.openrouter import OpenRouter
 from agno.tools import tool
 
-# Import rich for markdown rendering and styled output
+# rich is used for markdown rendering and styled output when installed
+_console = None
+_has_rich: Optional[bool] = None  # Unknown until the first render
+_make_panel: Optional[Callable[..., Any]] = None  # Panel factory with the static chrome bound
+_markdown_cls: Any = None
+
+# Optional C JSON encoder for large result sets
 try:
-    from rich.console import Console
-    from rich.markdown import Markdown
-    from rich.panel import Panel
-    from rich import box
-    _console = Console()
-    _has_rich = True
+    import orjson
+    _has_orjson = True
 except ImportError:
-    _has_rich = False
-    _console = None
+    orjson = None
+    _has_orjson = False
 
 # =============================================================================
 # ENV / CONNECTION
@@ -51,6 +81,10 @@ except ImportError:
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+_TRUTHY = frozenset({"1", "true", "yes", "y"})
+
 
 def _require_env(name: str, default: Optional[str] = None) -> str:
     """Fetch required environment variable or default; raise helpful error if missing."""
@@ -63,8 +97,15 @@ def _require_env(name: str, default: Optional[str] = None) -> str:
     return value
 
 
-def get_ibmi_credentials() -> Dict[str, Any]:
-    """Mapepire connection details. Default port is 8076."""
+@functools.lru_cache(maxsize=1)
+def get_ibmi_credentials() -> Mapping[str, Any]:
+    """
+    Mapepire connection details. Default port is 8076.
+
+    Resolved once per process and returned as a read-only mapping so callers
+    cannot mutate the cached value. Call get_ibmi_credentials.cache_clear()
+    after changing the environment (e.g. in tests).
+    """
     creds: Dict[str, Any] = {
         "host": _require_env("IBMI_HOST"),
         "port": int(_require_env("IBMI_PORT", "8076")),
@@ -72,9 +113,9 @@ def get_ibmi_credentials() -> Dict[str, Any]:
         "password": _require_env("IBMI_PASSWORD"),
     }
     ignore_unauth = os.getenv("IBMI_IGNORE_UNAUTHORIZED", "").strip().lower()
-    if ignore_unauth in {"1", "true", "yes", "y"}:
+    if ignore_unauth in _TRUTHY:
         creds["ignoreUnauthorized"] = True
-    return creds
+    return MappingProxyType(creds)
 
 
 # =============================================================================
@@ -91,23 +132,40 @@ _RETRY_DELAY_BASE = 2
 MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "500"))
 MAX_RESULT_BYTES = int(os.getenv("MAX_RESULT_BYTES", "500000"))  # Increased to 500KB to prevent truncation
 
+# Rows requested per cursor round trip
+_FETCH_BATCH_SIZE = int(os.getenv("IBMI_FETCH_BATCH_SIZE", "200"))
+
+# Detects an existing row-limiting clause without upper-casing the whole statement
+_HAS_LIMIT_RE = re.compile(r"\b(?:FETCH\s+FIRST|LIMIT)\b", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=32)
+def _row_cap_suffix(cap: int) -> str:
+    """FETCH FIRST clause appended by run_sql; one extra row detects truncation."""
+    return f"\nFETCH FIRST {cap + 1} ROWS ONLY"
+
+
+def _open_connection() -> Any:
+    """Open a new Mapepire connection (mapepire_python is imported on first use)."""
+    from mapepire_python import connect
+    return connect(dict(get_ibmi_credentials()))
+
 
 def _get_pooled_connection() -> Any:
     """Get a connection with retry logic and exponential backoff."""
-    creds = get_ibmi_credentials()
     for attempt in range(_MAX_RETRIES):
         try:
             if _connection_pool:
                 conn = _connection_pool.pop()
                 return conn
-            return connect(creds)
+            return _open_connection()
         except Exception as e:
             if attempt == _MAX_RETRIES - 1:
                 raise
             delay = _RETRY_DELAY_BASE ** attempt
-            print(f"[CONNECTION] Retry {attempt + 1}/{_MAX_RETRIES} after {delay}s: {e}", file=sys.stderr)
+            logger.warning("[CONNECTION] Retry %d/%d after %ds: %s", attempt + 1, _MAX_RETRIES, delay, e)
             _time.sleep(delay)
-    return connect(creds)
+    return _open_connection()
 
 
 def _return_connection_to_pool(conn: Any) -> None:
@@ -115,82 +173,320 @@ def _return_connection_to_pool(conn: Any) -> None:
     if len(_connection_pool) < _MAX_POOL_SIZE:
         _connection_pool.append(conn)
     else:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        _discard_connection(conn)
+
+
+def _discard_connection(conn: Any) -> None:
+    """Close a connection that may be broken instead of pooling it."""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+@atexit.register
+def _close_pool() -> None:
+    """Close pooled connections on interpreter shutdown."""
+    while _connection_pool:
+        _discard_connection(_connection_pool.pop())
+
+
+def _is_connection_error(exc: BaseException) -> bool:
+    """
+    True when the Mapepire websocket went away (not SQL errors or timeouts),
+    matching _is_dropped_session in ibmi_agent.py.
+    """
+    return isinstance(exc, ConnectionError) or "ConnectionClosed" in type(exc).__name__
+
+
+# Connection slot for the current agent request (see request_scope): a
+# one-element list, filled by the first run_sql call inside the scope
+_current_conn: ContextVar[Optional[List[Any]]] = ContextVar("ibmi_current_conn", default=None)
+
+
+@contextmanager
+def request_scope() -> Iterator[None]:
+    """
+    Share one pooled connection between every run_sql call made inside the
+    block, so a multi-tool answer pays for a single handshake. The
+    connection is acquired lazily by the first run_sql, so answers that
+    need no SQL never touch IBM i. Nested scopes reuse the outer slot.
+    """
+    if _current_conn.get() is not None:
+        yield
+        return
+
+    slot: List[Any] = [None]
+    token = _current_conn.set(slot)
+    try:
+        yield
+    except BaseException:
+        _current_conn.reset(token)
+        if slot[0] is not None:
+            _discard_connection(slot[0])
+        raise
+    else:
+        _current_conn.reset(token)
+        if slot[0] is not None:
+            _return_connection_to_pool(slot[0])
+
+
+_PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+
+
+def _is_flat_rows(result: Any) -> bool:
+    """True for the common Mapepire shape: a list of dicts of primitive values (first row checked)."""
+    return (
+        isinstance(result, list)
+        and bool(result)
+        and isinstance(result[0], dict)
+        and all(isinstance(v, _PRIMITIVE_TYPES) for v in result[0].values())
+    )
+
+
+# Compact separators: the LLM gains nothing from indentation, and it
+# roughly halves the payload for wide rows.
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), default=str)
+
+
+def _encode_bounded(result: Any, max_bytes: int) -> str:
+    """
+    Encode result as compact JSON, stopping once max_bytes is exceeded.
+
+    Large payloads are truncated to MAX_RESULT_BYTES anyway, so there is no
+    point serializing the remainder. Returns at least max_bytes + 1
+    characters when the full encoding would be longer.
+    """
+    parts: List[str] = []
+    size = 0
+    for chunk in _JSON_ENCODER.iterencode(result):
+        parts.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            break
+    return "".join(parts)
 
 
-def format_result(result: Any) -> str:
-    """Format results as readable JSON with size limits."""
+def format_result(result: Any, max_rows: int = MAX_RESULT_ROWS) -> str:
+    """Format results as compact JSON with size limits."""
     try:
         truncated = False
-        if isinstance(result, list) and len(result) > MAX_RESULT_ROWS:
-            result = result[:MAX_RESULT_ROWS]
+        if isinstance(result, list) and len(result) > max_rows:
+            result = result[:max_rows]
             truncated = True
 
-        output = json.dumps(result, indent=2, default=str)
+        if _has_orjson and _is_flat_rows(result):
+            output = orjson.dumps(result, default=str).decode()
+        else:
+            output = _encode_bounded(result, MAX_RESULT_BYTES)
 
         if len(output) > MAX_RESULT_BYTES:
             output = output[:MAX_RESULT_BYTES] + "\n... (truncated due to size)"
             truncated = True
         elif truncated:
-            output += f"\n... (truncated to {MAX_RESULT_ROWS} rows)"
+            output += f"\n... (truncated to {max_rows} rows)"
 
         return output
     except Exception:
         return str(result)
 
 
-def run_sql(sql: str, parameters: Optional[QueryParameters] = None) -> str:
-    """Execute SQL and return formatted results."""
-    creds = get_ibmi_credentials()
-    with connect(creds) as conn:
-        with conn.execute(sql, parameters=parameters) as cur:
-            if getattr(cur, "has_results", False):
-                raw = cur.fetchall()
-                if isinstance(raw, dict) and "data" in raw:
-                    return format_result(raw["data"])
-                return format_result(raw)
-            return "SQL executed successfully. No results returned."
+def _fetch_rows(cur: Any, limit: int) -> List[Any]:
+    """
+    Fetch rows in batches of _FETCH_BATCH_SIZE until the cursor is drained
+    or more than limit rows are buffered (the extra row marks truncation).
+    Handles Mapepire's dict-shaped batches ({"data": [...], "is_done": ...}).
+    """
+    if hasattr(cur, "arraysize"):
+        cur.arraysize = _FETCH_BATCH_SIZE
+
+    rows: List[Any] = []
+    while len(rows) <= limit:
+        chunk = cur.fetchmany(_FETCH_BATCH_SIZE)
+        done = False
+        if isinstance(chunk, dict):
+            done = bool(chunk.get("is_done"))
+            chunk = chunk.get("data") or []
+        if not chunk:
+            break
+        rows.extend(chunk)
+        if done:
+            break
+    return rows
+
+
+def run_sql(
+    sql: str,
+    parameters: Optional[QueryParameters] = None,
+    max_rows: Optional[int] = None,
+) -> str:
+    """
+    Execute SQL and return formatted results.
+
+    If the statement has no FETCH FIRST/LIMIT clause, one is appended so the
+    server caps the rows sent over the wire. One extra row is requested so
+    truncation can still be reported. max_rows lowers the cap below
+    MAX_RESULT_ROWS.
+    """
+    cap = MAX_RESULT_ROWS if max_rows is None else max(1, min(max_rows, MAX_RESULT_ROWS))
+    if not _HAS_LIMIT_RE.search(sql):
+        sql = sql.rstrip().rstrip(";") + _row_cap_suffix(cap)
+
+    scoped = _current_conn.get()
+    if scoped is not None:
+        if scoped[0] is None:
+            scoped[0] = _get_pooled_connection()
+        conn = scoped[0]
+    else:
+        conn = _get_pooled_connection()
+    try:
+        try:
+            result = _execute_on(conn, sql, parameters, cap)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            # Reused connection went stale: replace it and retry once
+            _discard_connection(conn)
+            conn = None
+            if scoped is not None:
+                scoped[0] = None
+            conn = _open_connection()
+            if scoped is not None:
+                scoped[0] = conn
+            result = _execute_on(conn, sql, parameters, cap)
+    except Exception as e:
+        if scoped is None and conn is not None:
+            if _is_connection_error(e):
+                _discard_connection(conn)
+            else:
+                _return_connection_to_pool(conn)
+        raise
+    if scoped is None:
+        _return_connection_to_pool(conn)
+    return result
+
+
+def _execute_on(conn: Any, sql: str, parameters: Optional[QueryParameters], cap: int) -> str:
+    """Run sql on an open connection and format up to cap rows."""
+    with conn.execute(sql, parameters=parameters) as cur:
+        if getattr(cur, "has_results", False):
+            return format_result(_fetch_rows(cur, cap), max_rows=cap)
+        return "SQL executed successfully. No results returned."
 
 
 # =============================================================================
 # SAFETY VALIDATION LAYER
 # =============================================================================
 
-_SAFE_IDENT = re.compile(r"^[A-Z0-9_#$@]{1,128}$", re.IGNORECASE)
+# Characters allowed in an IBM i identifier (ASCII only, either case)
+_IDENT_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_#$@")
 
+# Write/DDL/command keywords as one alternation, so a statement is checked
+# in a single regex pass. Semicolons and comments are left to _scan_sql,
+# which knows to ignore them inside quoted literals.
 _FORBIDDEN_SQL_TOKENS = re.compile(
-    r"(\bINSERT\b|\bUPDATE\b|\bDELETE\b|\bMERGE\b|\bDROP\b|\bALTER\b|\bCREATE\b|\bCALL\b|\bGRANT\b|\bREVOKE\b|\bRUN\b|\bCL:\b|\bQCMDEXC\b)",
+    r"\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|DROP|ALTER|CREATE|CALL|GRANT|REVOKE|RUN|QCMDEXC)\b|\bCL:\b",
     re.IGNORECASE,
 )
 
 # Only these schemas are allowed in queries
 _ALLOWED_SCHEMAS = {"QSYS2", "SYSTOOLS", "SYSIBM", "QSYS", "INFORMATION_SCHEMA"}
 
+# SQL keywords that look like schema refs (e.g. TABLE(...) or CAST(...))
+_SQL_KEYWORD_FALSE_POSITIVES = frozenset({"TABLE", "VALUES", "LATERAL", "CAST", "TRIM", "COALESCE", "CASE"})
+
+# Object types accepted by list-library-objects
+_VALID_OBJ_TYPES = frozenset({"*ALL", "*FILE", "*PGM", "*SRVPGM", "*DTAARA", "*DTAQ", "*OUTQ", "*JOBD", "*MSGQ"})
+
 # Expand with user-defined schemas from environment
 user_schemas = os.getenv("ALLOWED_USER_SCHEMAS", "").strip()
 if user_schemas:
     user_schemas_list = [s.strip().upper() for s in user_schemas.split(",") if s.strip()]
     _ALLOWED_SCHEMAS.update(user_schemas_list)
-    print(f"[SECURITY] User schemas enabled: {', '.join(user_schemas_list)}", file=sys.stderr)
+    logger.info("[SECURITY] User schemas enabled: %s", ", ".join(user_schemas_list))
+
+# Write-once after the environment expansion
+_ALLOWED_SCHEMAS = frozenset(_ALLOWED_SCHEMAS)
+
+
+@dataclass
+class _SqlScan:
+    """Facts gathered from one pass over a SQL statement."""
+    schema_refs: Set[str] = field(default_factory=set)
+    has_semicolon: bool = False
+    has_line_comment: bool = False
+    has_block_comment: bool = False
+
+
+def _skip_quoted(sql: str, i: int, quote: str) -> int:
+    """Return the index just past the quoted span starting at i (doubled quotes are escapes)."""
+    n = len(sql)
+    i += 1
+    while i < n:
+        if sql[i] == quote:
+            if i + 1 < n and sql[i + 1] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return n
+
+
+def _scan_sql(sql: str) -> _SqlScan:
+    """
+    Single pass over the SQL text collecting schema references and
+    statement separators / comment markers.
+
+    String literals ('...') and delimited identifiers ("...") are skipped,
+    so values like 'FOO.BAR' or 'a;b' do not trip the checks. Schema
+    references are identifiers followed by a '.', upper-cased; runs
+    starting with a digit are numeric literals and are ignored.
+    """
+    scan = _SqlScan()
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == "'" or ch == '"':
+            i = _skip_quoted(sql, i, ch)
+        elif ch in _IDENT_CHARS:
+            start = i
+            while i < n and sql[i] in _IDENT_CHARS:
+                i += 1
+            end = i
+            while i < n and sql[i].isspace():
+                i += 1
+            if i < n and sql[i] == "." and not sql[start].isdigit() and end - start <= 128:
+                scan.schema_refs.add(sql[start:end].upper())
+        else:
+            nxt = sql[i + 1] if i + 1 < n else ""
+            if ch == ";":
+                scan.has_semicolon = True
+            elif ch == "-" and nxt == "-":
+                scan.has_line_comment = True
+            elif ch == "/" and nxt == "*":
+                scan.has_block_comment = True
+            i += 1
+    return scan
 
 
 def _safe_ident(value: str, what: str = "identifier") -> str:
     """Validate and normalize an identifier."""
-    v = (value or "").strip()
-    if not v or not _SAFE_IDENT.match(v):
+    if type(value) is not str:
+        raise ValueError(f"Invalid {what}: {value!r}")
+    v = value.strip()
+    if not (0 < len(v) <= 128) or not _IDENT_CHARS.issuperset(v):
         raise ValueError(f"Invalid {what}: {value!r}")
     return v.upper()
 
 
 def _safe_limit(n: int, default: int = 50, max_n: int = 500) -> int:
     """Validate and constrain a numeric limit."""
-    try:
-        n = int(n)
-    except Exception:
-        return default
+    if not isinstance(n, int):
+        try:
+            n = int(n)
+        except (TypeError, ValueError):
+            return default
     return max(1, min(n, max_n))
 
 
@@ -209,12 +505,14 @@ def _validate_select_query(sql: str) -> None:
     if not (head.startswith("SELECT") or head.startswith("WITH")):
         raise ValueError("Only SELECT/WITH statements are allowed.")
 
+    scan = _scan_sql(s)
+
     # No multiple statements
-    if ";" in s:
+    if scan.has_semicolon:
         raise ValueError("Multiple statements are not allowed (no semicolons).")
 
     # No SQL comments (can hide malicious code)
-    if "--" in s or "/*" in s:
+    if scan.has_line_comment or scan.has_block_comment:
         raise ValueError("SQL comments are not allowed for security.")
 
     # No forbidden operations
@@ -222,10 +520,9 @@ def _validate_select_query(sql: str) -> None:
         raise ValueError("Forbidden SQL operation detected. Only read-only queries are allowed.")
 
     # Schema whitelist check
-    schema_refs = set(re.findall(r"\b([A-Z0-9_#$@]{1,128})\s*\.", s.upper()))
-    for sch in schema_refs:
+    for sch in scan.schema_refs:
         # Skip SQL keywords that look like schema refs
-        if sch in {"TABLE", "VALUES", "LATERAL", "CAST", "TRIM", "COALESCE", "CASE"}:
+        if sch in _SQL_KEYWORD_FALSE_POSITIVES:
             continue
         if sch not in _ALLOWED_SCHEMAS:
             raise ValueError(
@@ -238,30 +535,55 @@ def _validate_select_query(sql: str) -> None:
 # CORE TOOLS (4 tools instead of 73)
 # =============================================================================
 
-def _build_service_search_conditions(search_term: str) -> Tuple[str, List[str]]:
+_SERVICE_SEARCH_HAYSTACK = (
+    "UPPER(COALESCE(SERVICE_NAME, '') || ' ' || COALESCE(SERVICE_CATEGORY, '') || ' ' "
+    "|| CAST(COALESCE(EXAMPLE_SQL, '') AS VARCHAR(4000)))"
+)
+
+
+def _build_service_search_conditions(n_words: int) -> str:
     """
-    Build WHERE conditions for multi-word search.
-    Splits 'system status' into ['system', 'status'] and matches ANY word.
-    Also searches in SERVICE_NAME, SERVICE_CATEGORY, and EXAMPLE_SQL.
+    Build WHERE conditions for a multi-word search of n_words words.
+    Each word matches SERVICE_NAME, SERVICE_CATEGORY, or EXAMPLE_SQL through
+    one concatenated, upper-cased haystack and binds one parameter; words
+    are ORed so ANY word matches. Words never contain spaces, so a match
+    cannot straddle two columns.
     """
-    words = [w.strip().upper() for w in (search_term or "").split() if w.strip()]
-
-    if not words:
-        return "1=1", []  # No filter - return all
-
-    conditions = []
-    params = []
-    for word in words:
-        # Each word can match service name, category, or example SQL
-        conditions.append("""(
-            UPPER(SERVICE_NAME) LIKE '%' || ? || '%'
-            OR UPPER(SERVICE_CATEGORY) LIKE '%' || ? || '%'
-            OR UPPER(CAST(EXAMPLE_SQL AS VARCHAR(4000))) LIKE '%' || ? || '%'
-        )""")
-        params.extend([word, word, word])
+    if n_words <= 0:
+        return "1=1"  # No filter - return all
+
+    condition = f"{_SERVICE_SEARCH_HAYSTACK} LIKE '%' || ? || '%'"
 
     # Join with OR - match ANY word (more lenient search)
-    return "(" + " OR ".join(conditions) + ")", params
+    return "(" + " OR ".join([condition] * n_words) + ")"
+
+
+@functools.lru_cache(maxsize=16)
+def _services_sql(n_words: int, has_category: bool) -> str:
+    """
+    SERVICES_INFO search statement for a given query shape.
+
+    The text only depends on the word count and whether a category filter
+    is present, so it is built once per shape and DB2's statement cache
+    sees identical SQL on repeated searches.
+    """
+    where_clause = _build_service_search_conditions(n_words)
+    if has_category:
+        where_clause = f"{where_clause} AND UPPER(SERVICE_CATEGORY) LIKE '%' || ? || '%'"
+
+    return f"""
+        SELECT
+            SERVICE_SCHEMA_NAME,
+            SERVICE_NAME,
+            SERVICE_CATEGORY,
+            SQL_OBJECT_TYPE,
+            EARLIEST_POSSIBLE_RELEASE,
+            CAST(EXAMPLE_SQL AS VARCHAR(2000)) AS EXAMPLE_SQL
+        FROM QSYS2.SERVICES_INFO
+        WHERE {where_clause}
+        ORDER BY SERVICE_CATEGORY, SERVICE_NAME
+        FETCH FIRST ? ROWS ONLY
+        """
 
 
 @tool(name="discover-services", description="Search IBM i Services catalog. Use SINGLE KEYWORDS like 'JOB' or 'CERTIFICATE', not phrases. Only call this if the query doesn't match the Quick Reference in your instructions.")
@@ -282,29 +604,16 @@ def discover_services(
     TIP: Use SINGLE keywords for best results. "JOB" works better than "active jobs".
     """
     try:
-        # Build dynamic WHERE clause with word splitting
-        where_clause, params = _build_service_search_conditions(search_term)
+        # Split into words; each word binds one search parameter
+        words = [w.upper() for w in (search_term or "").split()]
+        params: List[Any] = list(words)
 
         # Add category filter if provided
         cat = (category or "").strip().upper()
         if cat:
-            where_clause = f"{where_clause} AND UPPER(SERVICE_CATEGORY) LIKE '%' || ? || '%'"
             params.append(cat)
 
-        # Build final SQL
-        sql = f"""
-        SELECT
-            SERVICE_SCHEMA_NAME,
-            SERVICE_NAME,
-            SERVICE_CATEGORY,
-            SQL_OBJECT_TYPE,
-            EARLIEST_POSSIBLE_RELEASE,
-            CAST(EXAMPLE_SQL AS VARCHAR(2000)) AS EXAMPLE_SQL
-        FROM QSYS2.SERVICES_INFO
-        WHERE {where_clause}
-        ORDER BY SERVICE_CATEGORY, SERVICE_NAME
-        FETCH FIRST ? ROWS ONLY
-        """
+        sql = _services_sql(len(words), bool(cat))
         params.append(_safe_limit(limit, default=30, max_n=100))
 
         return run_sql(sql, parameters=params)
@@ -380,18 +689,10 @@ def execute_sql(
         # Validate the SQL first
         _validate_select_query(sql)
 
-        # Apply row limit if not present
-        sql_upper = sql.upper()
-        if "FETCH FIRST" not in sql_upper and "LIMIT" not in sql_upper:
-            # Remove trailing whitespace and add limit
-            sql = sql.rstrip()
-            if sql.endswith(";"):
-                sql = sql[:-1]
-            lim = _safe_limit(limit_override, default=100, max_n=500)
-            sql = f"{sql}\nFETCH FIRST {lim} ROWS ONLY"
-
-        # Execute and return results
-        return run_sql(sql)
+        # Execute and return results; limit_override only applies when the
+        # query has no FETCH FIRST/LIMIT of its own (MAX_RESULT_ROWS still caps it)
+        lim = _safe_limit(limit_override, default=100, max_n=500)
+        return run_sql(sql, max_rows=None if _HAS_LIMIT_RE.search(sql) else lim)
 
     except ValueError as e:
         return f"""VALIDATION_ERROR: {e}
@@ -463,6 +764,21 @@ Check the EXAMPLE_SQL from discover-services for the correct syntax."""
         return f"ERROR: {type(e).__name__}: {e}"
 
 
+LIST_LIBRARY_OBJECTS_SQL = """
+SELECT
+    OBJNAME AS OBJECT_NAME,
+    OBJTYPE AS TYPE,
+    OBJSIZE AS SIZE_BYTES,
+    OBJTEXT AS DESCRIPTION,
+    OBJCREATED AS CREATED,
+    LAST_USED_TIMESTAMP AS LAST_USED,
+    OBJOWNER AS OWNER
+FROM TABLE(QSYS2.OBJECT_STATISTICS(?, ?)) AS X
+ORDER BY OBJNAME
+FETCH FIRST 100 ROWS ONLY
+"""
+
+
 @tool(name="list-library-objects", description="List all objects (tables, physical files, programs) in a user library. Use this for 'files in library', 'tables in schema', or 'library contents' queries. Much faster than multiple individual queries.")
 def list_library_objects(
     library: str,
@@ -490,25 +806,11 @@ def list_library_objects(
         lib = _safe_ident(library, what="library")
 
         # Validate object type (allow common IBM i object types)
-        valid_types = {"*ALL", "*FILE", "*PGM", "*SRVPGM", "*DTAARA", "*DTAQ", "*OUTQ", "*JOBD", "*MSGQ"}
         obj_type = (object_type or "*FILE").upper().strip()
-        if obj_type not in valid_types:
+        if obj_type not in _VALID_OBJ_TYPES:
             obj_type = "*FILE"  # Default to files
 
-        sql = f"""
-        SELECT
-            OBJNAME AS OBJECT_NAME,
-            OBJTYPE AS TYPE,
-            OBJSIZE AS SIZE_BYTES,
-            OBJTEXT AS DESCRIPTION,
-            OBJCREATED AS CREATED,
-            LAST_USED_TIMESTAMP AS LAST_USED,
-            OBJOWNER AS OWNER
-        FROM TABLE(QSYS2.OBJECT_STATISTICS('{lib}', '{obj_type}')) AS X
-        ORDER BY OBJNAME
-        FETCH FIRST 100 ROWS ONLY
-        """
-        return run_sql(sql)
+        return run_sql(LIST_LIBRARY_OBJECTS_SQL, parameters=[lib, obj_type])
 
     except ValueError as e:
         return f"VALIDATION_ERROR: {e}"
@@ -546,19 +848,21 @@ def read_source_member(
         start = max(1, int(start_line))
         limit = _safe_limit(num_lines, default=100, max_n=500)
 
-        # Query source file using qualified name with member parameter
+        # Query source file using qualified name with member parameter.
+        # The qualified name cannot be bound, but the range and limit can,
+        # so the statement text is stable for a given member.
         sql = f"""
         SELECT
             SRCSEQ AS LINE_NUM,
             CAST(SRCDTA AS VARCHAR(250)) AS SOURCE_LINE,
             CAST(SRCDAT AS VARCHAR(10)) AS DATE_CHANGED
         FROM {lib}.{srcfile}({member})
-        WHERE SRCSEQ >= {start}
+        WHERE SRCSEQ >= ?
         ORDER BY SRCSEQ
-        FETCH FIRST {limit} ROWS ONLY
+        FETCH FIRST ? ROWS ONLY
         """
 
-        return run_sql(sql)
+        return run_sql(sql, parameters=[start, limit])
 
     except ValueError as e:
         return f"VALIDATION_ERROR: {e}"
@@ -587,16 +891,36 @@ Common source files:
 # =============================================================================
 
 import time
-from threading import Thread
+from threading import RLock
 
 # Global state for thinking indicator and response buffering
-_thinking_active = False
-_thinking_thread = None
+_SPINNER_FRAMES = ("⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏")
+_SPINNER_INTERVAL = 0.1
+_spinner_idx = 0
+_spinner_last = 0.0
+_spinner_visible = False
+_spinner_drawn = False  # A frame is on screen and needs erasing
+_SPINNER_RESUME_DELAY = 0.3  # Quiet period before redrawing after a tool call
 _in_final_response = False
-_response_buffer = []  # Buffer for final response
+_response_buffer = io.StringIO()  # Buffer for final response
+
+
+def _reset_buffer(buf: io.StringIO) -> None:
+    """Empty a StringIO in place."""
+    buf.seek(0)
+    buf.truncate(0)
+
 _query_start_time = None  # Track query start time for response time
 _tool_call_count = 0  # Track number of tool calls
 _seen_tool_calls = False  # Track if we've seen any tool calls yet
+_force_final = False  # Set after the first tool call; later content is final-answer text
+
+# Markdown markers used to spot the start of a final answer
+_MD_FIRST_CHARS = frozenset("#-*`|")
+_LEADING_NUM_RE = re.compile(r"\d+\.")
+_MD_SUBSTRINGS = ("\n##", "\n- ", "```")
+_FINAL_PHASES = frozenset({"final", "answer"})
+
 
 def _is_final_response_chunk(chunk: RunOutputEvent) -> bool:
     """Best-effort detection of whether a run_content chunk belongs to the final answer.
@@ -608,14 +932,19 @@ def _is_final_response_chunk(chunk: RunOutputEvent) -> bool:
     - no rich markdown render
     - no green bordered panel
     """
+    if _force_final:
+        return True
+
     try:
         # Prefer explicit signal if provided
-        if hasattr(chunk, "is_final") and bool(getattr(chunk, "is_final")):
+        if getattr(chunk, "is_final", False):
             return True
         # Some event payloads include a phase/type field
-        if hasattr(chunk, "phase") and str(getattr(chunk, "phase")).lower() in {"final", "answer"}:
+        phase = getattr(chunk, "phase", None)
+        if phase is not None and str(phase).lower() in _FINAL_PHASES:
             return True
-        if hasattr(chunk, "content_type") and str(getattr(chunk, "content_type")).lower() in {"final", "answer"}:
+        content_type = getattr(chunk, "content_type", None)
+        if content_type is not None and str(content_type).lower() in _FINAL_PHASES:
             return True
     except Exception:
         pass
@@ -630,378 +959,537 @@ def _is_final_response_chunk(chunk: RunOutputEvent) -> bool:
     if not c:
         return False
 
-    markdownish = (
-        c.startswith("#")
-        or c.startswith("-")
-        or c.startswith("*")
-        or c.startswith("```")
-        or c.startswith("|")
-        or re.match(r"^\d+\.", c) is not None
-        or "\n##" in content
-        or "\n- " in content
-        or "```" in content
-    )
-    return bool(markdownish)
-
-def show_thinking_indicator():
-    """Display animated thinking indicator while waiting."""
-    global _thinking_active
-    symbols = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
-    idx = 0
-    while _thinking_active:
+    first = c[0]
+    if first in _MD_FIRST_CHARS:
+        return True
+    if "0" <= first <= "9" and _LEADING_NUM_RE.match(c):
+        return True
+    return any(s in content for s in _MD_SUBSTRINGS)
+
+def _tick_spinner() -> None:
+    """Advance the thinking indicator when it is visible and a frame is due.
+
+    Driven from handle_agent_event instead of a background thread, so it only
+    animates as events arrive and never contends with the streaming loop.
+    """
+    global _spinner_idx, _spinner_last, _spinner_drawn
+    if not _spinner_visible:
+        return
+    now = time.monotonic()
+    if now - _spinner_last >= _SPINNER_INTERVAL:
+        safe_print(f"\r💭 Thinking {_SPINNER_FRAMES[_spinner_idx % len(_SPINNER_FRAMES)]}  ", end="")
+        _spinner_idx += 1
+        _spinner_last = now
+        _spinner_drawn = True
+
+def _show_spinner(delay: float = 0.0) -> None:
+    """Make the thinking indicator visible.
+
+    With no delay the first frame is drawn at once. Otherwise drawing waits
+    until `delay` seconds have passed, so a tool call that follows straight
+    on does not flash the indicator on and off between tool banners.
+    """
+    global _spinner_visible, _spinner_last, _spinner_drawn
+    _spinner_visible = True
+    _spinner_drawn = False
+    if delay:
+        _spinner_last = time.monotonic() + delay - _SPINNER_INTERVAL
+    else:
+        _spinner_last = 0.0
+        _tick_spinner()
+
+def _clear_spinner() -> None:
+    """Erase the thinking indicator line, if shown."""
+    global _spinner_visible, _spinner_drawn
+    _spinner_visible = False
+    if _spinner_drawn:
+        _spinner_drawn = False
+        safe_print("\r" + " " * 30 + "\r", end="")
+
+class PrintBuffer:
+    """
+    Coalesce console output from the streaming loop.
+
+    Writes go to an in-memory buffer that is flushed to stdout at most every
+    FLUSH_INTERVAL seconds, on explicit flush() (tool boundaries, final
+    render) and on exit. While active, safe_print() routes through it, so a
+    stream of tiny LLM token chunks becomes one write per interval.
+    """
+
+    FLUSH_INTERVAL = 0.1
+
+    def __init__(self) -> None:
+        self._buf = io.StringIO()
+        self._lock = RLock()
+        self._last_flush = time.monotonic()
+        self._previous: Optional["PrintBuffer"] = None
+
+    def write(self, text: str) -> None:
+        with self._lock:
+            self._buf.write(text)
+            if time.monotonic() - self._last_flush > self.FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._last_flush = time.monotonic()
+            text = self._buf.getvalue()
+            if not text:
+                return
+            self._buf.seek(0)
+            self._buf.truncate(0)
+            try:
+                sys.stdout.write(text)
+            except UnicodeEncodeError:
+                # Last resort: encode as ASCII, replacing only problematic chars
+                # This preserves markdown formatting as much as possible
+                sys.stdout.write(text.encode('ascii', errors='replace').decode('ascii'))
+            sys.stdout.flush()
+
+    def __enter__(self) -> "PrintBuffer":
+        global _print_buffer
+        self._previous = _print_buffer
+        _print_buffer = self
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        global _print_buffer
+        self.flush()
+        _print_buffer = self._previous
+
+
+# Active PrintBuffer, if any (set by PrintBuffer.__enter__)
+_print_buffer: Optional[PrintBuffer] = None
+
+
+def _flush_output() -> None:
+    """Push any buffered console output to the terminal."""
+    if _print_buffer is not None:
+        _print_buffer.flush()
+
+
+def safe_print(text: str, end: str = "\n", **kwargs) -> None:
+    """Print text, through the active PrintBuffer if any.
+
+    stdout is reconfigured with errors="replace" at import, so no per-call
+    UnicodeEncodeError handling is needed here.
+    """
+    if _print_buffer is not None:
+        _print_buffer.write(text + end)
+        return
+    print(text, end=end, **kwargs)
+
+# (event class, candidate attribute names) -> getter for the first name present
+_attr_cache: Dict[Tuple[type, Tuple[str, ...]], Callable[[Any], Any]] = {}
+
+
+def _no_attr(_: Any) -> None:
+    return None
+
+
+def _pick(obj: Any, names: Tuple[str, ...]) -> Any:
+    """
+    Return the first of names present on obj (None if none are).
+
+    Agno event shapes differ between versions; which attribute holds a value
+    is resolved once per class and cached, so later events skip the probes.
+    """
+    key = (type(obj), names)
+    getter = _attr_cache.get(key)
+    if getter is None:
+        getter = _no_attr
+        for name in names:
+            if hasattr(obj, name):
+                getter = operator.attrgetter(name)
+                break
+        _attr_cache[key] = getter
+    return getter(obj)
+
+
+def _get_console() -> Any:
+    """Return the shared rich Console, importing rich on first use (None if unavailable).
+
+    The answer panel's title and styling are built once here and bound into
+    _make_panel, so each final render only wraps the new Markdown.
+    """
+    global _console, _has_rich, _make_panel, _markdown_cls
+    if _has_rich is None:
         try:
-            safe_print(f"\r💭 Thinking {symbols[idx % len(symbols)]}  ", end="", flush=True)
-        except:
-            # Fallback for encoding issues
-            print(f"\r[THINKING] {symbols[idx % len(symbols)]}  ", end="", flush=True)
-        idx += 1
-        time.sleep(0.1)
-    # Clear the thinking line
-    print("\r" + " " * 30 + "\r", end="", flush=True)
-
-def start_thinking():
-    """Start thinking indicator in background."""
-    global _thinking_active, _thinking_thread
-    if not _thinking_active:
-        _thinking_active = True
-        _thinking_thread = Thread(target=show_thinking_indicator, daemon=True)
-        _thinking_thread.start()
-
-def stop_thinking():
-    """Stop thinking indicator."""
-    global _thinking_active
-    if _thinking_active:
-        _thinking_active = False
-        time.sleep(0.15)  # Let thread finish
-
-def safe_print(text: str, **kwargs) -> None:
-    """Print text with fallback for encoding errors (Windows compatibility)."""
-    try:
-        print(text, **kwargs)
-    except UnicodeEncodeError:
-        # Last resort: encode as ASCII, replacing only problematic chars
-        # This preserves markdown formatting as much as possible
-        text_ascii = text.encode('ascii', errors='replace').decode('ascii')
-        print(text_ascii, **kwargs)
+            from rich import box
+            from rich.console import Console
+            from rich.markdown import Markdown
+            from rich.panel import Panel
+            from rich.text import Text
+        except ImportError:
+            _has_rich = False
+        else:
+            _console = Console(highlight=False, record=False)
+            _markdown_cls = Markdown
+            # HEAVY green-bordered panel for visual distinction
+            _make_panel = functools.partial(
+                Panel,
+                title=Text.from_markup("[bold white]📊 AGENT ANALYSIS[/bold white]"),
+                border_style="green",
+                box=box.HEAVY,  # Thicker border
+                padding=(1, 2),
+            )
+            _has_rich = True
+    return _console
+
+
+def _on_run_started(chunk: RunOutputEvent) -> None:
+    """Agent lifecycle: reset per-query state and start the spinner."""
+    global _query_start_time, _tool_call_count, _seen_tool_calls, _force_final
+    _query_start_time = time.time()  # Start timing
+    _tool_call_count = 0  # Reset tool count
+    _seen_tool_calls = False  # Reset tool call tracking
+    _force_final = False
+    _reset_buffer(_response_buffer)
+    safe_print("\n🤖 [AGENT] Starting to process your query...\n")
+    _show_spinner()  # Start thinking indicator
+
+
+def _on_run_completed(chunk: RunOutputEvent) -> None:
+    """Agent lifecycle: render the buffered final answer."""
+    global _in_final_response
+    _clear_spinner()  # Ensure thinking indicator is stopped
+
+    # Calculate response time
+    response_time = time.time() - _query_start_time if _query_start_time else 0
+
+    # Print complete buffered response with markdown rendering in green-bordered panel
+    full_response = _response_buffer.getvalue().strip()
+
+    _flush_output()
+
+    if full_response:
+        # Use rich Console with styled Panel for beautiful output
+        console = _get_console()
+        if console:
+            try:
+                # Create markdown object wrapped in the shared panel chrome
+                panel = _make_panel(_markdown_cls(full_response))
+
+                print()  # Add spacing before panel
+                console.print(panel)
+
+            except Exception as e:
+                # Fallback to plain print if markdown rendering fails
+                safe_print(f"\n[DEBUG] Markdown rendering failed: {e}")
+                print(full_response, flush=True)
+        else:
+            # Fallback: plain print without markdown rendering
+            try:
+                print(full_response, flush=True)
+            except UnicodeEncodeError:
+                safe_response = full_response.encode('ascii', errors='replace').decode('ascii')
+                print(safe_response, flush=True)
+
+    # Reset state for next query
+    _in_final_response = False
+    _reset_buffer(_response_buffer)
+
+    # Show completion message with timing and tool count
+    safe_print(f"\n✅ [AGENT] Query processing complete! (⏱️ {response_time:.2f}s, 🔧 {_tool_call_count} tool calls)\n")
+
+
+def _preview_discover(args: Dict[str, Any]) -> Optional[str]:
+    search = args.get("search_term", "")
+    return f"   └─ Searching for: '{search}'" if search else None
+
+
+def _preview_table_schema(args: Dict[str, Any]) -> Optional[str]:
+    schema = args.get("schema", "")
+    table = args.get("table_name", "")
+    return f"   └─ Schema: {schema}.{table}" if schema or table else None
+
+
+def _preview_sql(args: Dict[str, Any]) -> Optional[str]:
+    sql = args.get("sql", "")
+    if not sql:
+        return None
+    # Show first 100 chars of SQL (user preference)
+    sql_preview = sql[:100] + "..." if len(sql) > 100 else sql
+    # Clean up whitespace for single-line display
+    sql_preview = " ".join(sql_preview.split())
+    return f"   └─ SQL: {sql_preview}"
+
+
+def _preview_sample_data(args: Dict[str, Any]) -> Optional[str]:
+    schema = args.get("schema", "")
+    table = args.get("table_name", "")
+    limit = args.get("limit", 5)
+    return f"   └─ Fetching {limit} rows from {schema}.{table}" if schema or table else None
+
+
+def _preview_library_objects(args: Dict[str, Any]) -> Optional[str]:
+    library = args.get("library", "")
+    obj_type = args.get("object_type", "*FILE")
+    return f"   └─ Library: {library} (Type: {obj_type})" if library else None
+
+
+# Tool name -> one-line preview of its arguments (None when there is nothing to show)
+_TOOL_PREVIEW: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    "discover-services": _preview_discover,
+    "get-table-schema": _preview_table_schema,
+    "execute-sql": _preview_sql,
+    "get-sample-data": _preview_sample_data,
+    "list-library-objects": _preview_library_objects,
+}
+
+
+def _on_tool_call_started(chunk: RunOutputEvent) -> None:
+    """Tool execution: show which tool is called and a preview of its input."""
+    global _tool_call_count, _seen_tool_calls
+    _clear_spinner()  # Stop thinking while showing tool info
+    _tool_call_count += 1  # Increment tool call counter
+    # Mark that we're currently in a tool call (for content routing)
+    _seen_tool_calls = True
+
+    tool = chunk.tool
+    tool_name = tool.tool_name if tool else "unknown"
+
+    safe_print(f"\n🔧 [TOOL] Calling: {tool_name}")
+
+    # Show specific details based on tool
+    # Try multiple attribute names for tool arguments
+    tool_input = {}
+    if tool:
+        tool_input = (
+            _pick(tool, ("tool_args", "arguments"))
+            or _pick(chunk, ("tool_call_args", "args"))
+            or {}
+        )
+
+    if tool_input:
+        preview = _TOOL_PREVIEW.get(tool_name)
+        if preview:
+            line = preview(tool_input)
+            if line:
+                safe_print(line)
+
+    # Show the banner now; the tool may run for a while
+    _flush_output()
+
+
+def _on_tool_call_completed(chunk: RunOutputEvent) -> None:
+    """Tool execution: report errors or a short result summary."""
+    global _seen_tool_calls, _force_final
+    tool = chunk.tool
+
+    # Check for errors
+    err = getattr(chunk, "error", None)
+    if err:
+        safe_print(f"   └─ ❌ Error: {err}")
+    else:
+        # Try to get result info
+        result_preview = str(getattr(chunk, "result", "") or getattr(tool, "result", "") or "")
+
+        if len(result_preview) > 100 and result_preview.startswith("[{"):
+            # Estimate rows from the compact JSON row separators instead of
+            # parsing the whole payload just to print a count
+            n = result_preview.count("},{") + 1
+            safe_print(f"   └─ ✓ Returned ~{n} rows")
+        else:
+            safe_print("   └─ ✓ Complete")
+
+    _flush_output()
+
+    # Reset flag so next thinking text will be shown (before next tool)
+    _seen_tool_calls = False
+    # Content after a tool call is treated as the final answer
+    _force_final = True
+    # Resume thinking indicator after tool completion, unless another
+    # tool call starts right away
+    _show_spinner(_SPINNER_RESUME_DELAY)
+
+
+def _on_run_content(chunk: RunOutputEvent) -> None:
+    """LLM text streaming - show thinking text, buffer final response."""
+    global _in_final_response
+    content = getattr(chunk, "content", "") or ""
+    if content:
+        # If we're not in final response phase, show thinking text immediately
+        if not _in_final_response:
+            # Check if this looks like the start of final response
+            if _is_final_response_chunk(chunk):
+                _in_final_response = True
+                _response_buffer.write(content)
+            else:
+                # This is thinking text - show it immediately
+                _clear_spinner()  # Stop spinner to show thinking text
+                safe_print(content, end="", flush=True)
+        else:
+            # Already in final response - continue buffering
+            _response_buffer.write(content)
+
+
+def _on_reasoning_step(chunk: RunOutputEvent) -> None:
+    """Reasoning/planning events (if available)."""
+    reasoning = getattr(chunk, "reasoning_content", "") or ""
+    if reasoning:
+        reasoning_preview = reasoning[:100] + "..." if len(reasoning) > 100 else reasoning
+        safe_print(f"💭 [THINKING] {reasoning_preview}")
+
+
+def _on_other_event(chunk: RunOutputEvent) -> None:
+    """Events without a handler are ignored."""
+
+
+# Keyed by the event's string value (events may carry either the RunEvent
+# member or its plain string). run_content first - it is by far the most
+# frequent event.
+_HANDLERS: Dict[str, Callable[[RunOutputEvent], None]] = {
+    RunEvent.run_content.value: _on_run_content,
+    RunEvent.tool_call_started.value: _on_tool_call_started,
+    RunEvent.tool_call_completed.value: _on_tool_call_completed,
+    RunEvent.run_started.value: _on_run_started,
+    RunEvent.run_completed.value: _on_run_completed,
+    RunEvent.reasoning_step.value: _on_reasoning_step,
+}
+
 
 def handle_agent_event(chunk: RunOutputEvent) -> None:
     """
     Process and display streaming events from agent execution.
     Shows real-time progress: tools being called, SQL execution, results streaming.
     """
-    global _in_final_response, _response_buffer, _query_start_time, _tool_call_count, _seen_tool_calls
-
-    # Agent lifecycle events
-    if chunk.event == RunEvent.run_started:
-        _query_start_time = time.time()  # Start timing
-        _tool_call_count = 0  # Reset tool count
-        _seen_tool_calls = False  # Reset tool call tracking
-        _response_buffer.clear()
-        # Track final-only content as a safety net if buffering heuristics fail.
-        handle_agent_event._last_final_content = ""
-        safe_print("\n🤖 [AGENT] Starting to process your query...\n")
-        start_thinking()  # Start thinking indicator
-
-    elif chunk.event == RunEvent.run_completed:
-        stop_thinking()  # Ensure thinking indicator is stopped
-
-        # Calculate response time
-        response_time = time.time() - _query_start_time if _query_start_time else 0
-
-        # Print complete buffered response with markdown rendering in green-bordered panel
-        # If buffering didn't trigger (heuristic miss), fall back to last content seen.
-        full_response = "".join(_response_buffer).strip()
-        if not full_response and hasattr(handle_agent_event, "_last_final_content"):
-            full_response = str(getattr(handle_agent_event, "_last_final_content") or "").strip()
-
-        if full_response:
-            # Use rich Console with styled Panel for beautiful output
-            if _has_rich and _console:
-                try:
-                    # Create markdown object
-                    md = Markdown(full_response)
-
-                    # Wrap in a HEAVY green-bordered panel for visual distinction
-                    panel = Panel(
-                        md,
-                        title="[bold white]📊 AGENT ANALYSIS[/bold white]",
-                        border_style="green",
-                        box=box.HEAVY,  # Thicker border
-                        padding=(1, 2)
-                    )
-
-                    print()  # Add spacing before panel
-                    _console.print(panel)
-
-                except Exception as e:
-                    # Fallback to plain print if markdown rendering fails
-                    safe_print(f"\n[DEBUG] Markdown rendering failed: {e}")
-                    print(full_response, flush=True)
-            else:
-                # Fallback: plain print without markdown rendering
-                try:
-                    print(full_response, flush=True)
-                except UnicodeEncodeError:
-                    safe_response = full_response.encode('ascii', errors='replace').decode('ascii')
-                    print(safe_response, flush=True)
-
-        # Reset state for next query
-        _in_final_response = False
-        _response_buffer.clear()
-        handle_agent_event._last_final_content = ""
-
-        # Show completion message with timing and tool count
-        safe_print(f"\n✅ [AGENT] Query processing complete! (⏱️ {response_time:.2f}s, 🔧 {_tool_call_count} tool calls)\n")
-
-    # Tool execution events
-    elif chunk.event == RunEvent.tool_call_started:
-        stop_thinking()  # Stop thinking while showing tool info
-        _tool_call_count += 1  # Increment tool call counter
-        # Mark that we're currently in a tool call (for content routing)
-        _seen_tool_calls = True
-
-        tool = chunk.tool
-        tool_name = tool.tool_name if tool else "unknown"
-
-        safe_print(f"\n🔧 [TOOL] Calling: {tool_name}")
-
-        # Show specific details based on tool
-        # Try multiple attribute names for tool arguments
-        tool_input = {}
-        if tool:
-            if hasattr(tool, 'tool_args'):
-                tool_input = tool.tool_args or {}
-            elif hasattr(tool, 'arguments'):
-                tool_input = tool.arguments or {}
-            elif hasattr(chunk, 'tool_call_args'):
-                tool_input = chunk.tool_call_args or {}
-            elif hasattr(chunk, 'args'):
-                tool_input = chunk.args or {}
-
-        if tool_input:
-            if tool_name == "discover-services":
-                search = tool_input.get("search_term", "")
-                if search:
-                    safe_print(f"   └─ Searching for: '{search}'")
-
-            elif tool_name == "get-table-schema":
-                schema = tool_input.get("schema", "")
-                table = tool_input.get("table_name", "")
-                if schema or table:
-                    safe_print(f"   └─ Schema: {schema}.{table}")
-
-            elif tool_name == "execute-sql":
-                sql = tool_input.get("sql", "")
-                if sql:
-                    # Show first 100 chars of SQL (user preference)
-                    sql_preview = sql[:100] + "..." if len(sql) > 100 else sql
-                    # Clean up whitespace for single-line display
-                    sql_preview = " ".join(sql_preview.split())
-                    safe_print(f"   └─ SQL: {sql_preview}")
-
-            elif tool_name == "get-sample-data":
-                schema = tool_input.get("schema", "")
-                table = tool_input.get("table_name", "")
-                limit = tool_input.get("limit", 5)
-                if schema or table:
-                    safe_print(f"   └─ Fetching {limit} rows from {schema}.{table}")
-
-            elif tool_name == "list-library-objects":
-                library = tool_input.get("library", "")
-                obj_type = tool_input.get("object_type", "*FILE")
-                if library:
-                    safe_print(f"   └─ Library: {library} (Type: {obj_type})")
-
-    elif chunk.event == RunEvent.tool_call_completed:
-        tool = chunk.tool
-        tool_name = tool.tool_name if tool else "unknown"
-
-        # Check for errors
-        if hasattr(chunk, 'error') and chunk.error:
-            safe_print(f"   └─ ❌ Error: {chunk.error}")
-        else:
-            # Try to get result info
-            result_preview = ""
-            if hasattr(chunk, 'result'):
-                result_preview = str(chunk.result) if chunk.result else ""
-            elif tool and hasattr(tool, 'result'):
-                result_preview = str(tool.result) if tool.result else ""
-
-            if isinstance(result_preview, str) and len(result_preview) > 100:
-                # Count rows in JSON result
-                try:
-                    data = json.loads(result_preview)
-                    if isinstance(data, list):
-                        safe_print(f"   └─ ✓ Returned {len(data)} rows")
-                    else:
-                        safe_print(f"   └─ ✓ Complete")
-                except:
-                    safe_print(f"   └─ ✓ Complete")
-            else:
-                safe_print(f"   └─ ✓ Complete")
-
-        # Reset flag so next thinking text will be shown (before next tool)
-        _seen_tool_calls = False
-        # Resume thinking indicator after tool completion
-        start_thinking()
-
-    # LLM text streaming - Show thinking text, buffer final response
-    elif chunk.event == RunEvent.run_content:
-        content = chunk.content if hasattr(chunk, 'content') else ""
-        if content:
-            # If we're not in final response phase, show thinking text immediately
-            if not _in_final_response:
-                # Check if this looks like the start of final response
-                if _is_final_response_chunk(chunk):
-                    _in_final_response = True
-                    _response_buffer.append(content)
-                    handle_agent_event._last_final_content = (getattr(handle_agent_event, "_last_final_content", "") or "") + content
-                else:
-                    # This is thinking text - show it immediately
-                    stop_thinking()  # Stop spinner to show thinking text
-                    safe_print(content, end="", flush=True)
-            else:
-                # Already in final response - continue buffering
-                _response_buffer.append(content)
-                handle_agent_event._last_final_content = (getattr(handle_agent_event, "_last_final_content", "") or "") + content
-
-    # Reasoning/planning events (if available)
-    elif chunk.event == RunEvent.reasoning_step:
-        reasoning = chunk.reasoning_content if hasattr(chunk, 'reasoning_content') else ""
-        if reasoning:
-            reasoning_preview = reasoning[:100] + "..." if len(reasoning) > 100 else reasoning
-            safe_print(f"💭 [THINKING] {reasoning_preview}")
+    _tick_spinner()
+    event = chunk.event
+    _HANDLERS.get(getattr(event, "value", event), _on_other_event)(chunk)
 
 
 # =============================================================================
 # AGENT CONFIGURATION
 # =============================================================================
 
-AGENT_INSTRUCTIONS = dedent("""
-    You are an expert IBM i system assistant that generates SQL dynamically.
-
-    ## CRITICAL: Use Quick Reference FIRST - Skip Discovery When Possible!
-
-    For common queries, use these services DIRECTLY without calling discover-services.
-    Just call get-table-schema for columns, then execute-sql with your query.
-
-    ### Quick Reference - Common Services
-
-    | Keywords in Question | Service Name | SQL Syntax |
-    |---------------------|--------------|------------|
-    | system status, cpu %, memory, total jobs | SYSTEM_STATUS | SELECT * FROM TABLE(QSYS2.SYSTEM_STATUS()) AS X |
-    | top cpu jobs, active jobs, running jobs | ACTIVE_JOB_INFO | SELECT * FROM TABLE(QSYS2.ACTIVE_JOB_INFO(DETAILED_INFO=>'ALL')) AS X |
-    | listen ports, netstat, tcp, connections | NETSTAT_INFO | SELECT * FROM QSYS2.NETSTAT_INFO WHERE TCP_STATE = 'LISTEN' |
-    | users, profiles, authorities | USER_INFO | SELECT * FROM QSYS2.USER_INFO |
-    | certificates, ssl, expiring, https | CERTIFICATE_INFO | SELECT * FROM TABLE(QSYS2.CERTIFICATE_INFO('*SYSTEM','*ALL')) AS X |
-    | ptf, patches, fixes, updates | PTF_INFO | SELECT * FROM TABLE(QSYS2.PTF_INFO()) AS X |
-    | disk, asp, storage, disk space | ASP_INFO | SELECT * FROM QSYS2.ASP_INFO |
-    | messages, qsysopr, msgq | MESSAGE_QUEUE_INFO | SELECT * FROM TABLE(QSYS2.MESSAGE_QUEUE_INFO('QSYSOPR','QSYS')) AS X |
-    | plan cache, sql performance, slow queries | PLAN_CACHE_EVENT_INFO | SELECT * FROM TABLE(QSYS2.PLAN_CACHE_EVENT_INFO()) AS X |
-    | journals, journal receivers | JOURNAL_INFO | SELECT * FROM TABLE(QSYS2.JOURNAL_INFO(JOURNAL_LIBRARY=>'*ALL')) AS X |
-    | job queues, batch jobs waiting | JOB_QUEUE_INFO | SELECT * FROM QSYS2.JOB_QUEUE_INFO |
-    | subsystems, sbsd | SUBSYSTEM_INFO | SELECT * FROM QSYS2.SUBSYSTEM_INFO |
-    | system values, sysval | SYSTEM_VALUE_INFO | SELECT * FROM QSYS2.SYSTEM_VALUE_INFO |
-    | locks, object locks, waiting | OBJECT_LOCK_INFO | SELECT * FROM QSYS2.OBJECT_LOCK_INFO |
-    | library, libraries, library list | LIBRARY_INFO | SELECT * FROM QSYS2.LIBRARY_INFO |
-
-    ### Quick Reference - Library & Catalog Services (for user schemas)
-
-    | Keywords in Question | Service/Table | SQL Syntax |
-    |---------------------|---------------|------------|
-    | tables in library, physical files, files in library | SYSTABLES | SELECT TABLE_NAME, TABLE_TEXT, COLUMN_COUNT, ROW_LENGTH FROM QSYS2.SYSTABLES WHERE SYSTEM_TABLE_SCHEMA = 'LIBNAME' |
-    | table columns, describe table, table structure | SYSCOLUMNS | SELECT COLUMN_NAME, DATA_TYPE, LENGTH, COLUMN_TEXT FROM QSYS2.SYSCOLUMNS WHERE TABLE_SCHEMA = 'LIBNAME' AND TABLE_NAME = 'TABLENAME' |
-    | objects in library, library contents, file sizes | OBJECT_STATISTICS | SELECT * FROM TABLE(QSYS2.OBJECT_STATISTICS('LIBNAME', '*ALL')) AS X |
-    | physical files only | OBJECT_STATISTICS | SELECT * FROM TABLE(QSYS2.OBJECT_STATISTICS('LIBNAME', '*FILE')) AS X |
-
-    ### Quick Reference - Source Code Analysis
-
-    | Keywords in Question | Tool/Service | When to Use |
-    |---------------------|--------------|-------------|
-    | read source, show source code, examine RPG/CL | read-source-member | Direct access to source code lines from source physical files (QRPGLESRC, QCLLESRC, etc.) |
-    | list source members, members in source file | SYSPARTITIONSTAT | Get list of members with metadata: SELECT SYSTEM_TABLE_MEMBER, PARTITION_SIZE FROM QSYS2.SYSPARTITIONSTAT WHERE SYSTEM_TABLE_SCHEMA='LIBNAME' AND SYSTEM_TABLE_NAME='QRPGLESRC' |
-    | source member details, line count, last changed | SYSPARTITIONSTAT | Metadata only (no source code): SELECT SYSTEM_TABLE_MEMBER, PARTITION_SIZE, LAST_CHANGE_TIMESTAMP FROM QSYS2.SYSPARTITIONSTAT |
-
-    **IMPORTANT**: Use read-source-member tool for reading actual source code. This is far more efficient than trying multiple approaches!
-
-    ## IMPORTANT: Batching Rules for Multi-Table Queries
-
-    When analyzing multiple tables in a library (e.g., "insights of files in X library"):
-    1. **First**, list ALL tables with a SINGLE SYSTABLES or OBJECT_STATISTICS query
-    2. **Then**, get column info for only 2-3 KEY tables with SYSCOLUMNS (not all!)
-    3. **Finally**, sample data from only 2-3 REPRESENTATIVE tables (not every table!)
-    4. **NEVER** call get-sample-data more than 3 times in a single response
-    5. Summarize patterns across tables rather than examining each individually
-
-    ## When to Call discover-services
-
-    ONLY call discover-services if:
-    1. The query doesn't match any Quick Reference above
-    2. You need a specific/obscure service not listed
-    3. You're unsure which service to use
-
-    When searching, use SINGLE KEYWORDS like "JOB" or "SECURITY", not phrases.
-
-    ## Optimized Workflow
-
-    1. **Check Quick Reference** → If keywords match, skip to step 3!
-    2. **(Only if needed)** Call discover-services with single keyword
-    3. Always Call get-table-schema to get proper column names
-    4. Call execute-sql with your query
-    5. Search for helpful resources on web where required (prefer IBM i docs)                        
-    6. Analyze results and respond
-
-    ## SQL Generation Rules
-
-    **For TABLE FUNCTIONS** (most IBM i services):
-    ```sql
-    SELECT column1, column2
-    FROM TABLE(QSYS2.SERVICE_NAME(PARAM => 'value')) AS X
-    WHERE condition
-    ORDER BY column1 DESC
-    FETCH FIRST 50 ROWS ONLY
-    ```
-
-    **For VIEWs**:
-    ```sql
-    SELECT column1, column2
-    FROM QSYS2.VIEW_NAME
-    WHERE condition
-    ORDER BY column1
-    FETCH FIRST 100 ROWS ONLY
-    ```
-
-    ## Self-Correction
-
-    If you get an error, READ THE ERROR MESSAGE:
-    - "column not found" → Re-check schema with get-table-schema
-    - "not a valid table" → It's a TABLE FUNCTION, use TABLE(...) AS X syntax
-    - "validation error" → SQL violated safety rules, fix it
-    - "service not available" → IBM i version may be too old
-
-    ## Safety Rules (ENFORCED)
-    - ONLY SELECT/WITH queries
-    - NEVER INSERT, UPDATE, DELETE, DROP, CREATE, ALTER, CALL
-    - NEVER semicolons or SQL comments
-    - ONLY schemas: QSYS2, SYSTOOLS, SYSIBM, QSYS, INFORMATION_SCHEMA
-
-    ## Output Format
-    1. **Summary**: Brief answer with appropriate emoji (📊 💾 ⚠️ ✅ 🔧 📈 ⚡ 🎯 etc.)
-    2. **Evidence**: Key data points
-    3. **SQL Used**: Show the query
-    4. **Interpretation**: What the data means
-    5. **Next Actions**: Suggested follow-ups
-
-    ## Communication Style
-    - Use relevant emojis to make responses engaging and easier to scan
-    - Structure with clear headers and bullet points
-    - Be concise but informative
-    - Highlight important metrics and warnings with appropriate icons
-""")
+AGENT_INSTRUCTIONS = """
+You are an expert IBM i system assistant that generates SQL dynamically.
+
+## CRITICAL: Use Quick Reference FIRST - Skip Discovery When Possible!
+
+For common queries, use these services DIRECTLY without calling discover-services.
+Just call get-table-schema for columns, then execute-sql with your query.
+
+### Quick Reference - Common Services
+
+| Keywords in Question | Service Name | SQL Syntax |
+|---------------------|--------------|------------|
+| system status, cpu %, memory, total jobs | SYSTEM_STATUS | SELECT * FROM TABLE(QSYS2.SYSTEM_STATUS()) AS X |
+| top cpu jobs, active jobs, running jobs | ACTIVE_JOB_INFO | SELECT * FROM TABLE(QSYS2.ACTIVE_JOB_INFO(DETAILED_INFO=>'ALL')) AS X |
+| listen ports, netstat, tcp, connections | NETSTAT_INFO | SELECT * FROM QSYS2.NETSTAT_INFO WHERE TCP_STATE = 'LISTEN' |
+| users, profiles, authorities | USER_INFO | SELECT * FROM QSYS2.USER_INFO |
+| certificates, ssl, expiring, https | CERTIFICATE_INFO | SELECT * FROM TABLE(QSYS2.CERTIFICATE_INFO('*SYSTEM','*ALL')) AS X |
+| ptf, patches, fixes, updates | PTF_INFO | SELECT * FROM TABLE(QSYS2.PTF_INFO()) AS X |
+| disk, asp, storage, disk space | ASP_INFO | SELECT * FROM QSYS2.ASP_INFO |
+| messages, qsysopr, msgq | MESSAGE_QUEUE_INFO | SELECT * FROM TABLE(QSYS2.MESSAGE_QUEUE_INFO('QSYSOPR','QSYS')) AS X |
+| plan cache, sql performance, slow queries | PLAN_CACHE_EVENT_INFO | SELECT * FROM TABLE(QSYS2.PLAN_CACHE_EVENT_INFO()) AS X |
+| journals, journal receivers | JOURNAL_INFO | SELECT * FROM TABLE(QSYS2.JOURNAL_INFO(JOURNAL_LIBRARY=>'*ALL')) AS X |
+| job queues, batch jobs waiting | JOB_QUEUE_INFO | SELECT * FROM QSYS2.JOB_QUEUE_INFO |
+| subsystems, sbsd | SUBSYSTEM_INFO | SELECT * FROM QSYS2.SUBSYSTEM_INFO |
+| system values, sysval | SYSTEM_VALUE_INFO | SELECT * FROM QSYS2.SYSTEM_VALUE_INFO |
+| locks, object locks, waiting | OBJECT_LOCK_INFO | SELECT * FROM QSYS2.OBJECT_LOCK_INFO |
+| library, libraries, library list | LIBRARY_INFO | SELECT * FROM QSYS2.LIBRARY_INFO |
+
+### Quick Reference - Library & Catalog Services (for user schemas)
+
+| Keywords in Question | Service/Table | SQL Syntax |
+|---------------------|---------------|------------|
+| tables in library, physical files, files in library | SYSTABLES | SELECT TABLE_NAME, TABLE_TEXT, COLUMN_COUNT, ROW_LENGTH FROM QSYS2.SYSTABLES WHERE SYSTEM_TABLE_SCHEMA = 'LIBNAME' |
+| table columns, describe table, table structure | SYSCOLUMNS | SELECT COLUMN_NAME, DATA_TYPE, LENGTH, COLUMN_TEXT FROM QSYS2.SYSCOLUMNS WHERE TABLE_SCHEMA = 'LIBNAME' AND TABLE_NAME = 'TABLENAME' |
+| objects in library, library contents, file sizes | OBJECT_STATISTICS | SELECT * FROM TABLE(QSYS2.OBJECT_STATISTICS('LIBNAME', '*ALL')) AS X |
+| physical files only | OBJECT_STATISTICS | SELECT * FROM TABLE(QSYS2.OBJECT_STATISTICS('LIBNAME', '*FILE')) AS X |
+
+### Quick Reference - Source Code Analysis
+
+| Keywords in Question | Tool/Service | When to Use |
+|---------------------|--------------|-------------|
+| read source, show source code, examine RPG/CL | read-source-member | Direct access to source code lines from source physical files (QRPGLESRC, QCLLESRC, etc.) |
+| list source members, members in source file | SYSPARTITIONSTAT | Get list of members with metadata: SELECT SYSTEM_TABLE_MEMBER, PARTITION_SIZE FROM QSYS2.SYSPARTITIONSTAT WHERE SYSTEM_TABLE_SCHEMA='LIBNAME' AND SYSTEM_TABLE_NAME='QRPGLESRC' |
+| source member details, line count, last changed | SYSPARTITIONSTAT | Metadata only (no source code): SELECT SYSTEM_TABLE_MEMBER, PARTITION_SIZE, LAST_CHANGE_TIMESTAMP FROM QSYS2.SYSPARTITIONSTAT |
+
+**IMPORTANT**: Use read-source-member tool for reading actual source code. This is far more efficient than trying multiple approaches!
+
+## IMPORTANT: Batching Rules for Multi-Table Queries
+
+When analyzing multiple tables in a library (e.g., "insights of files in X library"):
+1. **First**, list ALL tables with a SINGLE SYSTABLES or OBJECT_STATISTICS query
+2. **Then**, get column info for only 2-3 KEY tables with SYSCOLUMNS (not all!)
+3. **Finally**, sample data from only 2-3 REPRESENTATIVE tables (not every table!)
+4. **NEVER** call get-sample-data more than 3 times in a single response
+5. Summarize patterns across tables rather than examining each individually
+
+## When to Call discover-services
+
+ONLY call discover-services if:
+1. The query doesn't match any Quick Reference above
+2. You need a specific/obscure service not listed
+3. You're unsure which service to use
+
+When searching, use SINGLE KEYWORDS like "JOB" or "SECURITY", not phrases.
+
+## Optimized Workflow
+
+1. **Check Quick Reference** → If keywords match, skip to step 3!
+2. **(Only if needed)** Call discover-services with single keyword
+3. Always Call get-table-schema to get proper column names
+4. Call execute-sql with your query
+5. Search for helpful resources on web where required (prefer IBM i docs)                        
+6. Analyze results and respond
+
+## SQL Generation Rules
+
+**For TABLE FUNCTIONS** (most IBM i services):
+```sql
+SELECT column1, column2
+FROM TABLE(QSYS2.SERVICE_NAME(PARAM => 'value')) AS X
+WHERE condition
+ORDER BY column1 DESC
+FETCH FIRST 50 ROWS ONLY
+```
+
+**For VIEWs**:
+```sql
+SELECT column1, column2
+FROM QSYS2.VIEW_NAME
+WHERE condition
+ORDER BY column1
+FETCH FIRST 100 ROWS ONLY
+```
+
+## Self-Correction
+
+If you get an error, READ THE ERROR MESSAGE:
+- "column not found" → Re-check schema with get-table-schema
+- "not a valid table" → It's a TABLE FUNCTION, use TABLE(...) AS X syntax
+- "validation error" → SQL violated safety rules, fix it
+- "service not available" → IBM i version may be too old
+
+## Safety Rules (ENFORCED)
+- ONLY SELECT/WITH queries
+- NEVER INSERT, UPDATE, DELETE, DROP, CREATE, ALTER, CALL
+- NEVER semicolons or SQL comments
+- ONLY schemas: QSYS2, SYSTOOLS, SYSIBM, QSYS, INFORMATION_SCHEMA
+
+## Output Format
+1. **Summary**: Brief answer with appropriate emoji (📊 💾 ⚠️ ✅ 🔧 📈 ⚡ 🎯 etc.)
+2. **Evidence**: Key data points
+3. **SQL Used**: Show the query
+4. **Interpretation**: What the data means
+5. **Next Actions**: Suggested follow-ups
+
+## Communication Style
+- Use relevant emojis to make responses engaging and easier to scan
+- Structure with clear headers and bullet points
+- Be concise but informative
+- Highlight important metrics and warnings with appropriate icons
+"""
 
 
 def build_agent() -> Agent:
     """Build the dynamic Text-to-SQL agent with 5 core tools."""
+    from agno.models.openrouter import OpenRouter
+
     model_id = os.getenv("OPENROUTER_MODEL_ID", "google/gemini-3-flash-preview")
 
     return Agent(
@@ -1024,6 +1512,9 @@ def build_agent() -> Agent:
 # MAIN LOOP
 # =============================================================================
 
+_EXIT_TOKENS = frozenset({"exit", "quit", "q"})
+
+
 def main() -> None:
     """Main interactive loop."""
     print("=" * 60)
@@ -1068,15 +1559,17 @@ def main() -> None:
         if not user_input:
             continue
 
-        if user_input.lower() in {"exit", "quit", "q"}:
+        if len(user_input) <= 4 and user_input.lower() in _EXIT_TOKENS:
             print("Goodbye!")
             break
 
         try:
-            # Stream events with all event types enabled
-            stream = agent.run(user_input, stream=True, stream_events=True)
-            for chunk in stream:
-                handle_agent_event(chunk)
+            # Stream events with all event types enabled; all tool calls
+            # for this question share one connection
+            with request_scope(), PrintBuffer():
+                stream = agent.run(user_input, stream=True, stream_events=True)
+                for chunk in stream:
+                    handle_agent_event(chunk)
         except KeyboardInterrupt:
             print("\n[CANCELLED] Query cancelled by user")
         except Exception as e:
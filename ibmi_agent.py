@@ -5,8 +5,21 @@ import os
 import re
 import sys
 import json
+import queue
+import atexit
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 from textwrap import dedent
-from typing import Any, Dict, Optional, List, Sequence, Tuple
+from typing import Any, Callable, Dict, FrozenSet, Iterator, Optional, List, Sequence, Tuple
+
+try:
+    import orjson as _orjson  # optional: faster result serialization
+except ImportError:
+    _orjson = None
 
 from dotenv import load_dotenv
 from mapepire_python import connect
@@ -38,7 +51,15 @@ def get_ibmi_credentials() -> Dict[str, Any]:
     """
     Mapepire connection details.
     Mapepire server default port is 8076.
+    Read from the environment once; each caller gets its own copy.
     """
+    return dict(_load_ibmi_credentials())
+
+
+@functools.lru_cache(maxsize=1)
+def _load_ibmi_credentials() -> Dict[str, Any]:
+    # Missing variables raise, and exceptions are not cached, so a later
+    # call after fixing the environment still works
     creds: Dict[str, Any] = {
         "host": _require_env("IBMI_HOST"),
         "port": int(_require_env("IBMI_PORT", "8076")),
@@ -60,8 +81,13 @@ def get_ibmi_credentials() -> Dict[str, Any]:
 
 import time as _time
 
-_connection_pool: List[Any] = []
+# Idle connections as (connection, returned_at), most recently returned last
+_connection_pool: List[Tuple[Any, float]] = []
+_pool_lock = threading.Lock()
 _MAX_POOL_SIZE = int(os.getenv("IBMI_POOL_SIZE", "5"))
+# Idle connections older than this are closed instead of reused; servers and
+# firewalls drop quiet websockets, and a dead one costs a failed round-trip
+_POOL_IDLE_SECONDS = float(os.getenv("IBMI_POOL_IDLE_SECONDS", "300"))
 _MAX_RETRIES = 3
 _RETRY_DELAY_BASE = 2  # Exponential backoff base (seconds)
 
@@ -75,14 +101,21 @@ def _get_pooled_connection() -> Any:
 
     for attempt in range(_MAX_RETRIES):
         try:
-            # Try to reuse pooled connection first
-            if _connection_pool:
-                conn = _connection_pool.pop()
-                # Test if connection is still valid
-                try:
-                    return conn
-                except Exception:
-                    pass  # Connection stale, create new one
+            # Try to reuse pooled connection first, dropping ones idle too long
+            stale: List[Any] = []
+            conn = None
+            now = _time.monotonic()
+            with _pool_lock:
+                while _connection_pool:
+                    candidate, returned_at = _connection_pool.pop()
+                    if now - returned_at < _POOL_IDLE_SECONDS:
+                        conn = candidate
+                        break
+                    stale.append(candidate)
+            for old in stale:
+                _discard_connection(old)
+            if conn is not None:
+                return conn
 
             # Create new connection
             return connect(creds)
@@ -100,13 +133,62 @@ def _get_pooled_connection() -> Any:
 
 def _return_connection_to_pool(conn: Any) -> None:
     """Return a connection to the pool if there's room."""
-    if len(_connection_pool) < _MAX_POOL_SIZE:
-        _connection_pool.append(conn)
-    else:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    with _pool_lock:
+        if len(_connection_pool) < _MAX_POOL_SIZE:
+            _connection_pool.append((conn, _time.monotonic()))
+            return
+    _discard_connection(conn)
+
+
+def _discard_connection(conn: Any) -> None:
+    """Close a connection that will not be reused."""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+@atexit.register
+def _close_pool() -> None:
+    """Close pooled connections at interpreter exit."""
+    with _pool_lock:
+        conns = [conn for conn, _ in _connection_pool]
+        _connection_pool.clear()
+    for conn in conns:
+        _discard_connection(conn)
+
+
+def _is_dropped_session(exc: BaseException) -> bool:
+    """True for errors meaning the Mapepire websocket went away (not SQL errors)."""
+    return isinstance(exc, ConnectionError) or "ConnectionClosed" in type(exc).__name__
+
+
+@contextmanager
+def _connection(creds: Optional[Dict[str, Any]] = None, fresh: bool = False) -> Iterator[Any]:
+    """
+    Borrow a pooled connection for the duration of the block, so tool calls
+    reuse a signed-on Mapepire job instead of connecting each time.
+    Explicit creds bypass the pool; fresh=True opens a new connection but
+    still returns it to the pool. An ordinary SQL error leaves the session
+    usable, so the connection goes back to the pool; it is closed instead
+    when the session was dropped, or when the block was interrupted
+    (KeyboardInterrupt, a generator closed mid-result).
+    """
+    if creds is not None:
+        with connect(creds) as conn:
+            yield conn
+        return
+
+    conn = connect(get_ibmi_credentials()) if fresh else _get_pooled_connection()
+    try:
+        yield conn
+    except BaseException as e:
+        if not isinstance(e, Exception) or _is_dropped_session(e):
+            _discard_connection(conn)
+        else:
+            _return_connection_to_pool(conn)
+        raise
+    _return_connection_to_pool(conn)
 
 
 # =============================================================================
@@ -117,8 +199,83 @@ MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "500"))
 MAX_RESULT_BYTES = int(os.getenv("MAX_RESULT_BYTES", "100000"))  # 100KB default
 
 
+# Row results as "json" (default), "table" (Markdown) or "tsv". The tabular
+# forms repeat column names once instead of per row: far fewer tokens.
+OUTPUT_FORMAT = os.getenv("IBMI_OUTPUT_FORMAT", "json").strip().lower()
+_MAX_CELL_CHARS = 200
+
+_JSON_SEPARATORS = (",", ":")
+
+
+def _dumps_compact(obj: Any) -> str:
+    """Compact JSON text; uses orjson when installed, stdlib json otherwise."""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj, default=str).decode()
+        except TypeError:
+            pass  # e.g. non-str dict keys; stdlib json handles those
+    return json.dumps(obj, separators=_JSON_SEPARATORS, default=str)
+
+
+def _rows_to_json(rows: List[Any]) -> Tuple[str, int]:
+    """
+    Compact JSON array with one row per line, plus the number of rows in it.
+    Only whole rows are emitted: serializing stops before the row that would
+    push the text past MAX_RESULT_BYTES (the first row is always kept).
+    """
+    parts: List[str] = []
+    size = 4  # "[\n" and "\n]"
+    for row in rows:
+        text = _dumps_compact(row)
+        size += len(text) + 2
+        if parts and size > MAX_RESULT_BYTES:
+            break
+        parts.append(text)
+    if not parts:
+        return "[]", 0
+    return "[\n" + ",\n".join(parts) + "\n]", len(parts)
+
+
+def _cell_text(value: Any, sep: str) -> str:
+    """One table cell: single line, at most _MAX_CELL_CHARS, separator escaped."""
+    text = "" if value is None else str(value)
+    if len(text) > _MAX_CELL_CHARS:
+        text = text[:_MAX_CELL_CHARS - 1] + "…"
+    text = text.replace("\r", " ").replace("\n", " ")
+    return text.replace("|", "\\|") if sep == "|" else text.replace("\t", " ")
+
+
+def _format_as_table(rows: List[Dict[str, Any]], markdown: bool = True) -> Tuple[str, int]:
+    """
+    Header line plus one line per row, as a Markdown table or TSV, plus the
+    number of rows in it. Emits whole rows only, like _rows_to_json.
+    """
+    columns = list(rows[0].keys())
+    if markdown:
+        lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    else:
+        lines = ["\t".join(columns)]
+    header = len(lines)
+    size = sum(len(line) + 1 for line in lines)
+    for row in rows:
+        if markdown:
+            line = "| " + " | ".join(_cell_text(row.get(c), "|") for c in columns) + " |"
+        else:
+            line = "\t".join(_cell_text(row.get(c), "\t") for c in columns)
+        size += len(line) + 1
+        if len(lines) > header and size > MAX_RESULT_BYTES:
+            break
+        lines.append(line)
+    return "\n".join(lines), len(lines) - header
+
+
+# Every truncation note starts with this; _SIZE_CUT_NOTE means a row was cut mid-way
+_TRUNCATED_NOTE = "\n... (truncated"
+_SIZE_CUT_NOTE = _TRUNCATED_NOTE + " due to size)"
+
+
 def format_mapepire_result(result: Any) -> str:
-    """Return readable JSON for the agent to interpret with size limits."""
+    """Return rows as compact JSON (one row per line) or a table (IBMI_OUTPUT_FORMAT), with size limits."""
     try:
         # Apply row limit if result is a list
         truncated = False
@@ -126,36 +283,120 @@ def format_mapepire_result(result: Any) -> str:
             result = result[:MAX_RESULT_ROWS]
             truncated = True
 
-        output = json.dumps(result, indent=2, default=str)
-
-        # Apply byte limit
+        shown = None
+        if isinstance(result, list) and OUTPUT_FORMAT in ("table", "tsv") and result \
+                and isinstance(result[0], dict):
+            output, shown = _format_as_table(result, markdown=OUTPUT_FORMAT == "table")
+        elif isinstance(result, list):
+            output, shown = _rows_to_json(result)
+        else:
+            output = _dumps_compact(result)
+
+        # Apply byte limit (list results are already cut at a row boundary,
+        # unless a single row is over the limit on its own)
         if len(output) > MAX_RESULT_BYTES:
-            output = output[:MAX_RESULT_BYTES] + "\n... (truncated due to size)"
+            output = output[:MAX_RESULT_BYTES] + _SIZE_CUT_NOTE
+            truncated = True
+        elif shown is not None and shown < len(result):
+            output += f"{_TRUNCATED_NOTE} to {shown} rows due to size)"
             truncated = True
         elif truncated:
-            output += f"\n... (truncated to {MAX_RESULT_ROWS} rows)"
+            output += f"{_TRUNCATED_NOTE} to {MAX_RESULT_ROWS} rows)"
 
         return output
     except Exception:
         return str(result)
 
 
+_DEFAULT_FETCH_SIZE = 256
+
+# Cursor class -> whether it exposes has_results, probed on first use
+# (mapepire_python does not export its cursor class for an import-time check)
+_CURSOR_HAS_RESULTS: Dict[type, bool] = {}
+
+
+def _has_results(cur: Any) -> bool:
+    """cur.has_results, treating cursors without the attribute as result-less."""
+    supported = _CURSOR_HAS_RESULTS.get(type(cur))
+    if supported is None:
+        supported = _CURSOR_HAS_RESULTS[type(cur)] = hasattr(cur, "has_results")
+    return supported and bool(cur.has_results)
+
+
+def _iter_batches(cur: Any, fetch_size: int) -> Iterator[List[Any]]:
+    """
+    Yield lists of up to fetch_size rows until the cursor is drained.
+    Handles Mapepire's dict-shaped batches ({"data": [...], "is_done": ...}).
+    """
+    if hasattr(cur, "arraysize"):
+        cur.arraysize = fetch_size
+
+    while True:
+        chunk = cur.fetchmany(fetch_size)
+        done = False
+        if isinstance(chunk, dict):
+            done = bool(chunk.get("is_done"))
+            chunk = chunk.get("data") or []
+        if not chunk:
+            return
+        yield chunk
+        if done:
+            return
+
+
+def _fetch_in_batches(cur: Any, fetch_size: int) -> List[Any]:
+    """
+    Fetch rows fetch_size at a time until the cursor is drained or more than
+    MAX_RESULT_ROWS are buffered (format_mapepire_result drops the rest anyway).
+    """
+    rows: List[Any] = []
+    for chunk in _iter_batches(cur, fetch_size):
+        rows.extend(chunk)
+        if len(rows) > MAX_RESULT_ROWS:
+            break
+    return rows
+
+
 def run_sql_statement(
     sql: str,
     parameters: Optional[QueryParameters] = None,
     creds: Optional[Dict[str, Any]] = None,
+    fetch_size: Optional[int] = None,
+    retry: bool = True,
 ) -> str:
-    """Execute SQL and return formatted results text."""
-    creds = creds or get_ibmi_credentials()
+    """
+    Execute SQL and return formatted results text.
+    With fetch_size, rows are pulled in batches of that many instead of one fetchall().
+    If a pooled session turns out to have been dropped (idle timeout, host
+    restart), the statement is retried once on a new connection. Pass
+    retry=False for writes, which the server may already have applied.
+    """
+    try:
+        with _connection(creds) as conn:
+            return _execute_formatted(conn, sql, parameters, fetch_size)
+    except Exception as e:
+        if not retry or creds is not None or not _is_dropped_session(e):
+            raise
+        print(f"[CONNECTION] Session dropped, retrying on a new connection: {e}", file=sys.stderr)
+    with _connection(fresh=True) as conn:
+        return _execute_formatted(conn, sql, parameters, fetch_size)
 
-    with connect(creds) as conn:
-        with conn.execute(sql, parameters=parameters) as cur:
-            if getattr(cur, "has_results", False):
-                raw = cur.fetchall()
-                if isinstance(raw, dict) and "data" in raw:
-                    return format_mapepire_result(raw["data"])
-                return format_mapepire_result(raw)
-            return "SQL executed successfully. No results returned."
+
+def _execute_formatted(
+    conn: Any,
+    sql: str,
+    parameters: Optional[QueryParameters] = None,
+    fetch_size: Optional[int] = None,
+) -> str:
+    """
+    Run one statement on an open connection and return formatted results text.
+    Rows are fetched in batches (fetch_size, default _DEFAULT_FETCH_SIZE) and
+    fetching stops once the MAX_RESULT_ROWS output cap is passed.
+    """
+    with conn.execute(sql, parameters=parameters) as cur:
+        if _has_results(cur):
+            return format_mapepire_result(_fetch_in_batches(cur, fetch_size or _DEFAULT_FETCH_SIZE))
+        return "SQL executed successfully. No results returned."
 
 
 def run_sql_raw(
@@ -167,11 +408,9 @@ def run_sql_raw(
     Execute SQL and return the raw python object.
     Useful for capability detection where we need to inspect structured results.
     """
-    creds = creds or get_ibmi_credentials()
-
-    with connect(creds) as conn:
+    with _connection(creds) as conn:
         with conn.execute(sql, parameters=parameters) as cur:
-            if getattr(cur, "has_results", False):
+            if _has_results(cur):
                 return cur.fetchall()
             return None
 
@@ -192,10 +431,34 @@ def _as_rows(raw: Any) -> List[Dict[str, Any]]:
 # SAFETY HELPERS (Prevent SQL injection; allow only safe identifiers & SELECT tools)
 # =============================================================================
 
-_SAFE_IDENT = re.compile(r"^[A-Z0-9_#$@]{1,128}$", re.IGNORECASE)
-_SAFE_SCHEMA = re.compile(r"^[A-Z0-9_#$@]{1,128}$", re.IGNORECASE)
-_FORBIDDEN_SQL_TOKENS = re.compile(
-    r"(\bINSERT\b|\bUPDATE\b|\bDELETE\b|\bMERGE\b|\bDROP\b|\bALTER\b|\bCREATE\b|\bCALL\b|\bGRANT\b|\bREVOKE\b|\bRUN\b|\bCL:\b|\bQCMDEXC\b)",
+def _lazy_pattern(pattern: str, flags: int = 0) -> Callable[[], "re.Pattern[str]"]:
+    """Return a getter that compiles pattern on first call and reuses it afterwards."""
+    return functools.lru_cache(maxsize=1)(lambda: re.compile(pattern, flags))
+
+
+# Longest statement _looks_like_safe_select will scan
+_MAX_SQL_LEN = int(os.getenv("MAX_SQL_LENGTH", str(64 * 1024)))
+
+# Characters allowed in an IBM i identifier (ASCII only, either case).
+# frozenset.issuperset(str) checks a name at C speed without the regex engine.
+_IDENT_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_#$@")
+# Write/DDL/command keywords, tested per word against a frozenset.
+# _word_re splits on the same boundaries as \b, so INSERT_TS is one word.
+_FORBIDDEN_TOKENS = frozenset({
+    "INSERT", "UPDATE", "DELETE", "MERGE", "DROP", "ALTER", "CREATE",
+    "CALL", "GRANT", "REVOKE", "RUN", "QCMDEXC",
+})
+# Only needed by the WHERE/ORDER BY validator and special library values;
+# compiled on first use. _SQL_SCAN_RE runs for every query and stays eager.
+_word_re = _lazy_pattern(r"\w+")
+_special_value_re = _lazy_pattern(r"^\*[A-Z0-9_]+$", re.IGNORECASE)
+# A whole CSV of identifiers with no blanks or empty pieces
+_csv_idents_re = _lazy_pattern(r"[A-Za-z0-9_#$@]{1,128}(?:,[A-Za-z0-9_#$@]{1,128})*")
+# Forbidden tokens and SCHEMA. references in one alternation, so a query is
+# classified in a single finditer pass
+_SQL_SCAN_RE = re.compile(
+    r"(?P<bad>\b(?:INSERT|UPDATE|DELETE|MERGE|DROP|ALTER|CREATE|CALL|GRANT|REVOKE|RUN|QCMDEXC)\b|\bCL:\b)"
+    r"|(?P<schema>\b[A-Z0-9_#$@]{1,128})\s*\.",
     re.IGNORECASE,
 )
 
@@ -209,18 +472,36 @@ if user_schemas:
     _ALLOWED_SCHEMAS.update(user_schemas_list)
     print(f"[SECURITY] User schemas enabled: {', '.join(user_schemas_list)}", file=sys.stderr)
 
+# Write-once after the environment expansion
+_ALLOWED_SCHEMAS = frozenset(_ALLOWED_SCHEMAS)
+
 # Store original system schemas for reference
-_SYSTEM_SCHEMAS = {"QSYS2", "SYSTOOLS", "SYSIBM", "QSYS", "INFORMATION_SCHEMA"}
+_SYSTEM_SCHEMAS = frozenset({"QSYS2", "SYSTOOLS", "SYSIBM", "QSYS", "INFORMATION_SCHEMA"})
 _USER_SCHEMAS = _ALLOWED_SCHEMAS - _SYSTEM_SCHEMAS
 
+# Sorted once for error messages (the sets never change after import)
+_ALLOWED_SCHEMAS_SORTED = tuple(sorted(_ALLOWED_SCHEMAS))
+_ALLOWED_SCHEMAS_TEXT = str(list(_ALLOWED_SCHEMAS_SORTED))
+_SYSTEM_SCHEMAS_TEXT = str(sorted(_SYSTEM_SCHEMAS))
+_USER_SCHEMAS_TEXT = str(sorted(_USER_SCHEMAS))
+_SCHEMAS_HINT_TEXT = f"System schemas: {_SYSTEM_SCHEMAS_TEXT}. User schemas: {_USER_SCHEMAS_TEXT}."
+
+# Keywords the schema-reference scan picks up that are not schemas (TABLE(...), LATERAL (...))
+_SQL_RESERVED_PREFIXES = frozenset({"TABLE", "VALUES", "LATERAL"})
 
+
+# The identifier validators are pure and see the same few names (QSYS2,
+# service names, libraries) over and over, so their results are memoized.
+# Rejections raise and are therefore never cached.
+@functools.lru_cache(maxsize=1024)
 def _safe_ident(value: str, what: str = "identifier") -> str:
     v = (value or "").strip()
-    if not v or not _SAFE_IDENT.match(v):
+    if not (0 < len(v) <= 128) or not _IDENT_CHARS.issuperset(v):
         raise ValueError(f"Invalid {what}: {value!r}")
     return v.upper()
 
 
+@functools.lru_cache(maxsize=1024)
 def _safe_ident_or_special(value: str, what: str = "identifier") -> str:
     """
     Like _safe_ident but also allows IBM i special values like *ALL, *ALLSIMPLE, *LIBL, etc.
@@ -232,28 +513,31 @@ def _safe_ident_or_special(value: str, what: str = "identifier") -> str:
     # Allow normal identifiers OR IBM i special values starting with *
     if v.startswith("*"):
         # Validate special value format: *WORD (alphanumeric after asterisk)
-        if not re.match(r"^\*[A-Z0-9_]+$", v, re.IGNORECASE):
+        if not _special_value_re().match(v):
             raise ValueError(f"Invalid {what}: {value!r}")
         return v.upper()
     # Otherwise use normal identifier validation
-    if not _SAFE_IDENT.match(v):
+    if len(v) > 128 or not _IDENT_CHARS.issuperset(v):
         raise ValueError(f"Invalid {what}: {value!r}")
     return v.upper()
 
 
+@functools.lru_cache(maxsize=1024)
 def _safe_schema(value: str) -> str:
     v = (value or "").strip()
-    if not v or not _SAFE_SCHEMA.match(v):
+    if not (0 < len(v) <= 128) or not _IDENT_CHARS.issuperset(v):
         raise ValueError(f"Invalid schema: {value!r}")
     return v.upper()
 
 
+@functools.lru_cache(maxsize=256)
 def _safe_csv_idents(value: str, what: str = "list") -> str:
-    parts = [p.strip() for p in (value or "").split(",") if p.strip()]
-    if not parts:
-        return ""
-    norm = [_safe_ident(p, what=what) for p in parts]
-    return ",".join(norm)
+    # Common case: one regex match over the whole list
+    if value and _csv_idents_re().fullmatch(value):
+        return value.upper()
+    # Otherwise per piece, for whitespace/blank pieces and precise errors.
+    # _safe_ident strips each piece itself; blank pieces are skipped
+    return ",".join(_safe_ident(p, what=what) for p in (value or "").split(",") if p and not p.isspace())
 
 
 def _safe_limit(n: int, default: int = 10, max_n: int = 5000) -> int:
@@ -271,30 +555,42 @@ def _looks_like_safe_select(sql: str) -> None:
     - Must not contain forbidden tokens
     - Must not contain multiple statements (;)
     - Must reference only allowed schemas (best effort heuristic)
+    - Must not exceed _MAX_SQL_LEN characters
     """
+    if sql and len(sql) > _MAX_SQL_LEN:
+        raise ValueError(f"SQL exceeds max length {_MAX_SQL_LEN}.")
     s = (sql or "").strip()
     if not s:
         raise ValueError("Empty SQL is not allowed.")
 
-    head = s.lstrip().upper()
-    if not (head.startswith("SELECT") or head.startswith("WITH")):
-        raise ValueError("Only SELECT/WITH statements are allowed.")
-
+    # Cheapest rejections first; the regex scans below walk the whole text
     if ";" in s:
         raise ValueError("Multiple statements are not allowed (no semicolons).")
 
-    if _FORBIDDEN_SQL_TOKENS.search(s):
-        raise ValueError("Forbidden SQL operation detected. Only read-only queries are allowed.")
+    if not s[:6].upper().startswith(("SELECT", "WITH")):
+        raise ValueError("Only SELECT/WITH statements are allowed.")
 
-    schema_refs = set(re.findall(r"\b([A-Z0-9_#$@]{1,128})\s*\.", s.upper()))
-    for sch in schema_refs:
-        if sch in {"TABLE", "VALUES", "LATERAL"}:
-            continue
-        if sch not in _ALLOWED_SCHEMAS:
-            raise ValueError(
-                f"Query references non-allowed schema '{sch}'. "
-                f"Allowed schemas: {sorted(_ALLOWED_SCHEMAS)}"
-            )
+    if "." not in s:
+        # No SCHEMA. references are possible, so any scan hit is a forbidden token
+        if _SQL_SCAN_RE.search(s):
+            raise ValueError("Forbidden SQL operation detected. Only read-only queries are allowed.")
+        return
+
+    # Collect names as written and upper-case only the distinct ones; a large
+    # query repeats the same correlation prefixes (A.COL, B.COL) many times
+    raw_refs = set()
+    for m in _SQL_SCAN_RE.finditer(s):
+        if m.lastgroup == "bad":
+            raise ValueError("Forbidden SQL operation detected. Only read-only queries are allowed.")
+        raw_refs.add(m.group("schema"))
+    schema_refs = {r.upper() for r in raw_refs}
+    bad = schema_refs - _SQL_RESERVED_PREFIXES - _ALLOWED_SCHEMAS
+    if bad:
+        names = ", ".join(f"'{sch}'" for sch in sorted(bad))
+        raise ValueError(
+            f"Query references non-allowed schema {names}. "
+            f"Allowed schemas: {_ALLOWED_SCHEMAS_TEXT}"
+        )
 
 
 def _validate_simple_clause(clause: str, clause_type: str) -> str:
@@ -305,29 +601,39 @@ def _validate_simple_clause(clause: str, clause_type: str) -> str:
     """
     if not clause:
         return ""
+    if len(clause) > _MAX_SQL_LEN:
+        raise ValueError(f"{clause_type} clause exceeds max length {_MAX_SQL_LEN}.")
     clause = clause.strip()
     if not clause:
         return ""
     # Reject parentheses - prevents subqueries, function calls that could be exploited
     if "(" in clause or ")" in clause:
         raise ValueError(f"Parentheses not allowed in {clause_type} clause (security restriction)")
+    upper_clause = clause.upper()
+    words = _word_re().findall(upper_clause)
     # Reject SELECT keyword - prevents subqueries
-    if re.search(r'\bSELECT\b', clause, re.IGNORECASE):
+    if "SELECT" in words:
         raise ValueError(f"SELECT keyword not allowed in {clause_type} clause (security restriction)")
     # Reject semicolons - prevents statement chaining
     if ";" in clause:
         raise ValueError(f"Semicolons not allowed in {clause_type} clause (security restriction)")
     # Also check for forbidden tokens
-    if _FORBIDDEN_SQL_TOKENS.search(clause):
+    if "CL:" in upper_clause or not _FORBIDDEN_TOKENS.isdisjoint(words):
         raise ValueError(f"Forbidden SQL operation in {clause_type} clause")
     return clause
 
 
-def run_select(sql: str, parameters: Optional[QueryParameters] = None) -> str:
+# Statement text -> already passed the guardrail. Tools run the same
+# templates over and over; only text that validated is cached (failures raise).
+_validated_select = functools.lru_cache(maxsize=256)(_looks_like_safe_select)
+
+
+def run_select(sql: str, parameters: Optional[QueryParameters] = None,
+               fetch_size: Optional[int] = None) -> str:
     """Execute safe read-only SELECT/WITH query with guardrails and friendly errors."""
     try:
-        _looks_like_safe_select(sql)
-        return run_sql_statement(sql, parameters=parameters)
+        _validated_select(sql)
+        return run_sql_statement(sql, parameters=parameters, fetch_size=fetch_size)
     except ValueError as e:
         # Validation errors - return clean error message without stack trace
         return f"ERROR: {e}"
@@ -335,85 +641,322 @@ def run_select(sql: str, parameters: Optional[QueryParameters] = None) -> str:
         return f"ERROR executing SQL Service/cat query. Details: {type(e).__name__}: {e}"
 
 
+def run_select_batch(
+    queries: Sequence[Tuple[str, Optional[QueryParameters], Optional[int]]],
+) -> List[str]:
+    """
+    Like run_select for several (sql, parameters, fetch_size) queries, but all
+    of them run over one connection, so a tool that needs related result sets
+    pays for a single connect/sign-on. Each entry gets its own result or ERROR text.
+    """
+    results: List[Optional[str]] = [None] * len(queries)
+    runnable: List[int] = []
+    for i, (sql, _, _) in enumerate(queries):
+        try:
+            _validated_select(sql)
+            runnable.append(i)
+        except ValueError as e:
+            results[i] = f"ERROR: {e}"
+
+    if runnable:
+        try:
+            with _connection() as conn:
+                for i in runnable:
+                    sql, parameters, fetch_size = queries[i]
+                    try:
+                        results[i] = _execute_formatted(conn, sql, parameters, fetch_size)
+                    except Exception as e:
+                        if _is_dropped_session(e):
+                            raise  # _connection discards it; the rest get this error below
+                        results[i] = f"ERROR executing SQL Service/cat query. Details: {type(e).__name__}: {e}"
+        except Exception as e:
+            for i in runnable:
+                if results[i] is None:
+                    results[i] = f"ERROR executing SQL Service/cat query. Details: {type(e).__name__}: {e}"
+
+    return [r or "" for r in results]
+
+
+def run_select_columns(sql: str, parameters: Optional[QueryParameters] = None) -> Dict[str, List[Any]]:
+    """
+    Guarded SELECT returning column name -> list of values, for Python callers
+    that post-process results instead of handing text to the model. Skips the
+    per-cell JSON stringification done by run_select. Raises on errors.
+    """
+    _validated_select(sql)
+    rows = _as_rows(run_sql_raw(sql, parameters=parameters))
+    if not rows:
+        return {}
+    names = list(rows[0].keys())
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def run_select_arrow(sql: str, parameters: Optional[QueryParameters] = None) -> Any:
+    """Like run_select_columns but returns a pyarrow.Table (requires pyarrow)."""
+    # Imported here, not at module load: pyarrow is heavy and only this helper uses it
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("pyarrow is required for run_select_arrow (pip install pyarrow)") from None
+    return pa.table(run_select_columns(sql, parameters=parameters))
+
+
+# Rows per round-trip for the high-limit tools and run_select_iter.
+_STREAM_CHUNK_ROWS = 500
+
+
+def run_select_iter(sql: str, parameters: Optional[QueryParameters] = None,
+                    chunk: int = _STREAM_CHUNK_ROWS) -> Iterator[List[Any]]:
+    """
+    Guarded SELECT yielding lists of up to chunk rows as they are fetched,
+    for Python callers that walk large result sets without holding them all.
+    The pooled connection is held until the generator is exhausted or closed
+    (closing early discards it, since its cursor is mid-result). Raises on errors.
+    """
+    _validated_select(sql)
+    with _connection() as conn:
+        with conn.execute(sql, parameters=parameters) as cur:
+            if _has_results(cur):
+                yield from _iter_batches(cur, max(1, int(chunk)))
+
+
+# Concurrent SELECTs per run_select_many call. Defaults to the pool size so
+# every worker can reuse a pooled connection instead of signing on anew.
+_MAX_PARALLEL_SELECTS = max(1, int(os.getenv("IBMI_SQL_PARALLEL", str(_MAX_POOL_SIZE))))
+
+
+def run_select_many(queries: Sequence[Tuple[str, Optional[QueryParameters]]]) -> List[str]:
+    """
+    Run independent (sql, parameters) SELECTs concurrently, each on its own
+    connection, and return their results in input order. Wall-clock time is
+    roughly that of the slowest query instead of the sum.
+    """
+    if not queries:
+        return []
+    workers = min(_MAX_PARALLEL_SELECTS, len(queries))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda q: run_select(q[0], parameters=q[1]), queries))
+
+
 # =============================================================================
 # IBM i 7.6 SERVICE DISCOVERY (from 7.3 compatibility layer)
 # =============================================================================
 
-SERVICES_INFO_EXISTS_SQL = """
-SELECT 1 AS X
-FROM QSYS2.SERVICES_INFO
-WHERE SERVICE_SCHEMA_NAME = ?
-  AND SERVICE_NAME = ?
-FETCH FIRST 1 ROWS ONLY
+# One row per requested (schema, name) pair that exists in SERVICES_INFO.
+# {values} is a list of "(CAST(? ...), CAST(? ...))" rows, one per pair.
+SERVICES_INFO_EXISTS_BATCH_SQL = """
+SELECT T.S AS SERVICE_SCHEMA_NAME, T.N AS SERVICE_NAME
+FROM (VALUES {values}) AS T(S, N)
+WHERE EXISTS (
+  SELECT 1
+  FROM QSYS2.SERVICES_INFO I
+  WHERE I.SERVICE_SCHEMA_NAME = T.S
+    AND I.SERVICE_NAME = T.N
+)
 """
 
-_services_cache: Dict[Tuple[str, str], bool] = {}
-_services_preloaded: bool = False
+# On-demand lookups: bounded LRU of (schema, name) -> (exists, checked_at).
+# Entries expire so a service installed (or removed) later is picked up.
+_SERVICES_CACHE_MAX = 512
+_SERVICES_CACHE_TTL = float(os.getenv("IBMI_SERVICES_CACHE_TTL", "300"))
+_services_cache: "OrderedDict[Tuple[str, str], Tuple[bool, float]]" = OrderedDict()
+_services_lock = threading.Lock()  # OrderedDict reordering is not thread-safe
+
+# Full SERVICES_INFO snapshot taken by preload_services(), refreshed after the TTL
+_preloaded_services: FrozenSet[Tuple[str, str]] = frozenset()
+_services_loaded_at: Optional[float] = None
+
+
+def _services_cache_get(key: Tuple[str, str]) -> Optional[bool]:
+    """Return the cached answer for key, or None if missing or expired."""
+    with _services_lock:
+        entry = _services_cache.get(key)
+        if entry is None:
+            return None
+        ok, checked_at = entry
+        if _time.monotonic() - checked_at >= _SERVICES_CACHE_TTL:
+            del _services_cache[key]
+            return None
+        _services_cache.move_to_end(key)
+        return ok
+
+
+def _services_cache_put(key: Tuple[str, str], ok: bool) -> None:
+    """Record an on-demand answer, evicting the least recently used entry when full."""
+    with _services_lock:
+        _services_cache[key] = (ok, _time.monotonic())
+        _services_cache.move_to_end(key)
+        if len(_services_cache) > _SERVICES_CACHE_MAX:
+            _services_cache.popitem(last=False)
+
+
+def invalidate_service_cache() -> None:
+    """
+    Forget every cached service answer (e.g. after installing PTFs).
+    A preloaded snapshot is re-read on the next lookup; otherwise lookups go back to on-demand checks.
+    """
+    global _services_loaded_at
+    with _services_lock:
+        _services_cache.clear()
+        if _services_loaded_at is not None:
+            _services_loaded_at = float("-inf")
 
 
 def preload_services() -> int:
     """
     Preload all available services at startup for faster tool execution.
+    The snapshot is reused until it is older than _SERVICES_CACHE_TTL.
     Returns count of services loaded.
     """
-    global _services_preloaded, _services_cache
+    global _preloaded_services, _services_loaded_at
 
-    if _services_preloaded:
-        return len(_services_cache)
+    if _services_loaded_at is not None and _time.monotonic() - _services_loaded_at < _SERVICES_CACHE_TTL:
+        return len(_preloaded_services)
 
     try:
         sql = "SELECT SERVICE_SCHEMA_NAME, SERVICE_NAME FROM QSYS2.SERVICES_INFO"
         raw = run_sql_raw(sql)
         rows = _as_rows(raw)
+        found = set()
         for row in rows:
             schema = row.get("SERVICE_SCHEMA_NAME", "").upper()
             name = row.get("SERVICE_NAME", "").upper()
             if schema and name:
-                _services_cache[(schema, name)] = True
-        _services_preloaded = True
-        print(f"[SERVICES] Preloaded {len(_services_cache)} IBM i services", file=sys.stderr)
-        return len(_services_cache)
+                found.add((schema, name))
+        _preloaded_services = frozenset(found)
+        _services_loaded_at = _time.monotonic()
+        print(f"[SERVICES] Preloaded {len(_preloaded_services)} IBM i services", file=sys.stderr)
+        return len(_preloaded_services)
     except Exception as e:
+        if _services_loaded_at is not None:
+            # Keep serving the previous snapshot rather than retrying on every lookup
+            _services_loaded_at = _time.monotonic()
+            print(f"[SERVICES] Refresh failed (keeping previous snapshot): {e}", file=sys.stderr)
+            return len(_preloaded_services)
         print(f"[SERVICES] Preload failed (will check on-demand): {e}", file=sys.stderr)
         return 0
 
 
+@functools.lru_cache(maxsize=32)
+def _services_exist_sql(n_pairs: int) -> str:
+    """SERVICES_INFO_EXISTS_BATCH_SQL with a VALUES row for each of n_pairs pairs."""
+    row = "(CAST(? AS VARCHAR(128)), CAST(? AS VARCHAR(128)))"
+    return SERVICES_INFO_EXISTS_BATCH_SQL.format(values=", ".join([row] * n_pairs))
+
+
+def services_exist(pairs: Sequence[Tuple[str, str]]) -> Dict[Tuple[str, str], bool]:
+    """
+    Check several (schema, service_name) pairs against QSYS2.SERVICES_INFO at once.
+    Pairs not answered by the preload snapshot or the on-demand cache are
+    resolved with a single query. Keys of the result are normalized (upper-case).
+    """
+    result: Dict[Tuple[str, str], bool] = {}
+    missing: List[Tuple[str, str]] = []
+    for schema, service_name in pairs:
+        key = (_safe_schema(schema), _safe_ident(service_name, what="service_name"))
+        if key in result:
+            continue
+        # If preloaded, use the snapshot directly (absence means service doesn't exist)
+        if _services_loaded_at is not None:
+            preload_services()  # no-op unless the snapshot has expired
+            result[key] = key in _preloaded_services
+            continue
+        ok = _services_cache_get(key)
+        if ok is None:
+            missing.append(key)
+            result[key] = False
+        else:
+            result[key] = ok
+
+    if not missing:
+        return result
+
+    # Fallback to one on-demand query for everything uncached
+    params: List[str] = []
+    for key in missing:
+        params.extend(key)
+    try:
+        raw = run_sql_raw(_services_exist_sql(len(missing)), parameters=params)
+        for row in _as_rows(raw):
+            key = (str(row.get("SERVICE_SCHEMA_NAME", "")).upper(), str(row.get("SERVICE_NAME", "")).upper())
+            if key in result:
+                result[key] = True
+    except Exception:
+        pass  # Treat as unavailable, as the single-service check always did
+
+    for key in missing:
+        _services_cache_put(key, result[key])
+    return result
+
+
 def service_exists(schema: str, service_name: str) -> bool:
     """
     Check for service presence via QSYS2.SERVICES_INFO.
     This catalog is the supported way to determine IBM i Services availability.
     Uses preloaded cache if available, falls back to on-demand query.
     """
-    sch = _safe_schema(schema)
-    svc = _safe_ident(service_name, what="service_name")
-    key = (sch, svc)
-
-    # If preloaded, use cache directly (absence means service doesn't exist)
-    if _services_preloaded:
-        return key in _services_cache
+    key = (_safe_schema(schema), _safe_ident(service_name, what="service_name"))
+    return services_exist([key])[key]
+
+
+# Every service a tool below guards on with service_exists()
+_REQUIRED_SERVICES: Tuple[Tuple[str, str], ...] = (
+    ("QSYS2", "AUTHORITY_COLLECTION_IFS"),
+    ("QSYS2", "DB_TRANSACTION_INFO"),
+    ("QSYS2", "DUMP_PLAN_CACHE"),
+    ("QSYS2", "HARDWARE_RESOURCE_INFO"),
+    ("QSYS2", "HTTP_DELETE_VERBOSE"),
+    ("QSYS2", "HTTP_PATCH_VERBOSE"),
+    ("QSYS2", "IFS_OBJECT_LOCK_INFO"),
+    ("QSYS2", "IFS_OBJECT_STATISTICS"),
+    ("QSYS2", "JOBLOG_INFO"),
+    ("QSYS2", "NETSTAT_JOB_INFO"),
+    ("QSYS2", "PROGRAM_REFERENCES"),
+    ("QSYS2", "SECURITY_INFO"),
+    ("QSYS2", "SPOOLED_FILE_INFO"),
+    ("QSYS2", "SQLSTATE_INFO"),
+    ("QSYS2", "SUBSYSTEM_POOL_INFO"),
+    ("QSYS2", "SUBSYSTEM_ROUTING_INFO"),
+    ("QSYS2", "VERIFY_NAME"),
+    ("SYSTOOLS", "CERTIFICATE_USAGE_INFO"),
+)
 
-    # Fallback to on-demand check with caching
-    if key in _services_cache:
-        return _services_cache[key]
 
-    try:
-        raw = run_sql_raw(SERVICES_INFO_EXISTS_SQL, parameters=[sch, svc])
-        rows = _as_rows(raw)
-        ok = len(rows) > 0
-    except Exception:
-        ok = False
-
-    _services_cache[key] = ok
-    return ok
+def warm_required_services() -> int:
+    """
+    Resolve every service in _REQUIRED_SERVICES in one round trip, so the
+    first call of each guarded tool is a cache hit. Returns how many exist.
+    """
+    found = services_exist(_REQUIRED_SERVICES)
+    return sum(1 for ok in found.values() if ok)
 
 
 # =============================================================================
 # SQL TEMPLATES (IBM i Services + Catalogs)
 # =============================================================================
 
-SYSTEM_STATUS_SQL = "SELECT * FROM TABLE(QSYS2.SYSTEM_STATUS(RESET_STATISTICS => 'NO', DETAILED_INFO => 'ALL')) X"
+SYSTEM_STATUS_SQL = "SELECT * FROM TABLE(QSYS2.SYSTEM_STATUS(RESET_STATISTICS => 'NO', DETAILED_INFO => 'ALL')) X WITH UR"
+# Opt-in only: resets the elapsed-time counters for every later caller too
+SYSTEM_STATUS_RESET_SQL = "SELECT * FROM TABLE(QSYS2.SYSTEM_STATUS(RESET_STATISTICS => 'YES', DETAILED_INFO => 'ALL')) X WITH UR"
 SYSTEM_ACTIVITY_SQL = "SELECT * FROM TABLE(QSYS2.SYSTEM_ACTIVITY_INFO())"
 
+# SYSTEM_STATUS plus the SYSTEM_ACTIVITY_INFO rates in one row / one round-trip.
+# Activity columns are renamed because SYSTEM_STATUS has same-named CPU columns;
+# they are renamed inside a subselect so no column is alias-qualified (the
+# guardrail reads "X." as a schema reference).
+SYSTEM_SNAPSHOT_SQL = """
+SELECT *
+FROM TABLE(QSYS2.SYSTEM_STATUS(RESET_STATISTICS => 'NO', DETAILED_INFO => 'ALL')) S
+CROSS JOIN (
+  SELECT AVERAGE_CPU_RATE AS ACTIVITY_AVERAGE_CPU_RATE,
+         AVERAGE_CPU_UTILIZATION AS ACTIVITY_AVERAGE_CPU_UTILIZATION,
+         MINIMUM_CPU_UTILIZATION AS ACTIVITY_MINIMUM_CPU_UTILIZATION,
+         MAXIMUM_CPU_UTILIZATION AS ACTIVITY_MAXIMUM_CPU_UTILIZATION
+  FROM TABLE(QSYS2.SYSTEM_ACTIVITY_INFO()) X
+) A
+WITH UR
+"""
+
 SERVICES_SEARCH_SQL = """
 SELECT SERVICE_CATEGORY, SERVICE_SCHEMA_NAME, SERVICE_NAME, SQL_OBJECT_TYPE, EARLIEST_POSSIBLE_RELEASE
 FROM QSYS2.SERVICES_INFO
@@ -442,6 +985,7 @@ FROM TABLE(
 ) X
 ORDER BY CPU_TIME DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 MSGW_JOBS_SQL = """
@@ -457,6 +1001,7 @@ FROM TABLE(QSYS2.ACTIVE_JOB_INFO(DETAILED_INFO => 'ALL')) X
 WHERE JOB_STATUS = 'MSGW'
 ORDER BY SUBSYSTEM, CPU_TIME DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 ASP_INFO_SQL = "SELECT * FROM QSYS2.ASP_INFO ORDER BY ASP_NUMBER"
@@ -474,6 +1019,7 @@ SELECT ASP_NUMBER,
 FROM QSYS2.SYSDISKSTAT
 ORDER BY PERCENT_USED DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 NETSTAT_SUMMARY_SQL = """
@@ -486,6 +1032,7 @@ SELECT LOCAL_ADDRESS,
 FROM QSYS2.NETSTAT_INFO
 ORDER BY IDLE_TIME DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 QSYSOPR_RECENT_MSGS_SQL = """
@@ -502,6 +1049,7 @@ WHERE MSGQ_LIB = 'QSYS'
   AND MSGQ_NAME = 'QSYSOPR'
 ORDER BY MSG_TIME DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 OUTQ_HOTSPOTS_SQL = """
@@ -513,6 +1061,7 @@ SELECT OUTPUT_QUEUE_LIBRARY_NAME AS OUTQ_LIB,
 FROM QSYS2.OUTPUT_QUEUE_INFO
 ORDER BY NUMBER_OF_FILES DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 ENDED_JOB_INFO_SQL = """
@@ -537,6 +1086,7 @@ SELECT AUTHORIZATION_NAME,
 FROM QSYS2.USER_STORAGE
 ORDER BY STORAGE_USED DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 IFS_OBJECT_STATISTICS_SQL = """
@@ -548,6 +1098,7 @@ SELECT PATH_NAME,
 FROM TABLE(QSYS2.IFS_OBJECT_STATISTICS(?)) X
 ORDER BY DATA_SIZE DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 OBJECT_CHANGED_RECENTLY_SQL = """
@@ -825,6 +1376,7 @@ FROM TABLE(QSYS2.IFS_OBJECT_STATISTICS(
 WHERE DATA_SIZE > ?
 ORDER BY DATA_SIZE DESC
 FETCH FIRST ? ROWS ONLY
+WITH UR
 """
 
 IFS_OBJECT_LOCK_INFO_SQL = """
@@ -997,6 +1549,7 @@ ORDER BY OBJSIZE DESC
 FETCH FIRST ? ROWS ONLY
 """
 
+# Columns are left unqualified: the guardrail reads "LI." as a schema reference.
 LIBRARY_SIZES_ALL_SQL = """
 WITH libs (ln) AS (
   SELECT OBJNAME
@@ -1004,14 +1557,14 @@ WITH libs (ln) AS (
 )
 SELECT
   ln AS LIBRARY,
-  LI.OBJECT_COUNT,
-  LI.LIBRARY_SIZE AS LIBRARY_SIZE_BYTES,
-  ROUND(LI.LIBRARY_SIZE / 1e+9, 2) AS LIBRARY_SIZE_GB,
-  LI.LIBRARY_SIZE_COMPLETE,
-  LI.LIBRARY_TYPE,
-  LI.TEXT_DESCRIPTION,
-  LI.IASP_NAME,
-  LI.IASP_NUMBER
+  OBJECT_COUNT,
+  LIBRARY_SIZE AS LIBRARY_SIZE_BYTES,
+  ROUND(LIBRARY_SIZE / 1e+9, 2) AS LIBRARY_SIZE_GB,
+  LIBRARY_SIZE_COMPLETE,
+  LIBRARY_TYPE,
+  TEXT_DESCRIPTION,
+  IASP_NAME,
+  IASP_NUMBER
 FROM libs,
 LATERAL (
   SELECT *
@@ -1022,7 +1575,7 @@ LATERAL (
     )
   )
 ) LI
-ORDER BY LI.LIBRARY_SIZE DESC
+ORDER BY LIBRARY_SIZE DESC
 FETCH FIRST ? ROWS ONLY
 """
 
@@ -1034,14 +1587,14 @@ WITH libs (ln) AS (
 )
 SELECT
   ln AS LIBRARY,
-  LI.OBJECT_COUNT,
-  LI.LIBRARY_SIZE AS LIBRARY_SIZE_BYTES,
-  ROUND(LI.LIBRARY_SIZE / 1e+9, 2) AS LIBRARY_SIZE_GB,
-  LI.LIBRARY_SIZE_COMPLETE,
-  LI.LIBRARY_TYPE,
-  LI.TEXT_DESCRIPTION,
-  LI.IASP_NAME,
-  LI.IASP_NUMBER
+  OBJECT_COUNT,
+  LIBRARY_SIZE AS LIBRARY_SIZE_BYTES,
+  ROUND(LIBRARY_SIZE / 1e+9, 2) AS LIBRARY_SIZE_GB,
+  LIBRARY_SIZE_COMPLETE,
+  LIBRARY_TYPE,
+  TEXT_DESCRIPTION,
+  IASP_NAME,
+  IASP_NUMBER
 FROM libs,
 LATERAL (
   SELECT *
@@ -1052,21 +1605,238 @@ LATERAL (
     )
   )
 ) LI
-ORDER BY LI.LIBRARY_SIZE DESC
+ORDER BY LIBRARY_SIZE DESC
 FETCH FIRST ? ROWS ONLY
 """
 
+# Two-phase variant: rank libraries by OBJECT_COUNT (cheap, no size walk) and
+# compute LIBRARY_SIZE only for the top {candidates}. Approximate: a library
+# with few but very large objects can be missed. {exclude} is "" or a WHERE.
+LIBRARY_SIZES_CANDIDATES_SQL = """
+WITH libs (ln) AS (
+  SELECT OBJNAME
+  FROM TABLE(QSYS2.OBJECT_STATISTICS('*ALLSIMPLE', 'LIB')) AS L
+  {exclude}
+),
+cand (cn) AS (
+  SELECT ln
+  FROM libs,
+  LATERAL (
+    SELECT OBJECT_COUNT
+    FROM TABLE(QSYS2.LIBRARY_INFO(LIBRARY_NAME => ln)) B
+  ) C
+  ORDER BY OBJECT_COUNT DESC
+  FETCH FIRST {candidates} ROWS ONLY
+)
+SELECT
+  cn AS LIBRARY,
+  OBJECT_COUNT,
+  LIBRARY_SIZE AS LIBRARY_SIZE_BYTES,
+  ROUND(LIBRARY_SIZE / 1e+9, 2) AS LIBRARY_SIZE_GB,
+  LIBRARY_SIZE_COMPLETE,
+  LIBRARY_TYPE,
+  TEXT_DESCRIPTION,
+  IASP_NAME,
+  IASP_NUMBER
+FROM cand,
+LATERAL (
+  SELECT *
+  FROM TABLE(
+    QSYS2.LIBRARY_INFO(
+      LIBRARY_NAME => cn,
+      DETAILED_INFO => 'LIBRARY_SIZE'
+    )
+  )
+) LI
+ORDER BY LIBRARY_SIZE DESC
+FETCH FIRST ? ROWS ONLY
+"""
+_LIBRARY_SIZES_EXCLUDE_SYSTEM = "WHERE LEFT(OBJNAME, 1) NOT IN ('Q', '#')"
+# Candidates sized per requested row in the two-phase variant
+_LIBRARY_SIZE_CANDIDATE_FACTOR = 4
+
+TABLE_ROW_STATS_SQL = "SELECT NUMBER_ROWS, NUMBER_DELETED_ROWS, DATA_SIZE FROM QSYS2.SYSTABLESTAT WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?"
+
+# Multi-row INSERT written by _flush_metrics; {values} is one _METRICS_ROW per sample
+METRICS_INSERT_SQL = "INSERT INTO SAMPLE.METRICS (TS, CPU_PCT, ASP_PCT) VALUES {values}"
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _compact_sql(sql: str) -> str:
+    """Collapse whitespace runs outside '...' literals to one space (fewer bytes on the wire)."""
+    parts = sql.split("'")
+    # Even-indexed parts are outside literals ('' escapes keep the parity)
+    for i in range(0, len(parts), 2):
+        parts[i] = _WS_RE.sub(" ", parts[i])
+    return "'".join(parts).strip()
+
+
+# Compact and intern the templates so in-process caches keyed on SQL text
+# (_with_limit) can match on identity before comparing characters. Templates
+# that run as-is (no limit or {placeholder} to fill in) are also run through
+# the guardrail once here, so run_select finds them in _validated_select's
+# cache from the first call and a template that trips the guardrail shows up
+# at startup. (No template uses -- comments, which compaction would break.)
+for _name, _value in list(globals().items()):
+    if _name.endswith("_SQL") and isinstance(_value, str):
+        _value = globals()[_name] = sys.intern(_compact_sql(_value))
+        if "{" not in _value and "FETCH FIRST ?" not in _value:
+            try:
+                _validated_select(_value)
+            except ValueError as e:
+                print(f"[SQL] Template {_name} fails the SELECT guardrail: {e}", file=sys.stderr)
+del _name, _value
+
 # =============================================================================
 # GENERIC HELPERS (runbook/checklist templates + user query builder)
 # =============================================================================
 
-def _render_template(title: str, bullets: List[str]) -> str:
+@functools.lru_cache(maxsize=128)
+def _render_template(title: str, bullets: Tuple[str, ...]) -> str:
     lines = [f"# {title}", ""]
     for b in bullets:
         lines.append(f"- {b}")
     return "\n".join(lines)
 
 
+@functools.lru_cache(maxsize=256)
+def _with_limit(template: str, limit: int) -> str:
+    """
+    Bake a validated row limit into a template ending in FETCH FIRST ? ROWS ONLY.
+    The literal lets Db2 plan for the row goal instead of a host variable; the
+    limit bind parameter is dropped by the caller. OPTIMIZE FOR states the same
+    goal explicitly so the ORDER BY can be satisfied with a top-N sort.
+    """
+    n = int(limit)
+    return template.replace("FETCH FIRST ? ROWS ONLY", f"FETCH FIRST {n} ROWS ONLY OPTIMIZE FOR {n} ROWS")
+
+
+# Slow-changing, expensive system views: seconds a result stays fresh.
+# Other kinds use IBMI_SQL_TTL (default 30s; 0 disables them).
+_SNAPSHOT_TTL: Dict[str, float] = {
+    "privileged_profiles": 3600,
+    "public_all_objects": 3600,
+    "authorization_lists": 3600,
+    "user_storage": 300,
+    "disk_hotspots": 60,
+}
+_SQL_CACHE_TTL = float(os.getenv("IBMI_SQL_TTL", "30"))
+_SNAPSHOT_CACHE_MAX = 256
+# (sql, parameters) -> (kind, stored_at, result), least recently used first
+_snapshot_cache: "OrderedDict[Tuple[str, Tuple[Any, ...]], Tuple[str, float, str]]" = OrderedDict()
+_snapshot_lock = threading.Lock()
+
+
+def _snapshot_select(kind: str, sql: str, use_cache: bool = True,
+                     parameters: Optional[QueryParameters] = None) -> str:
+    """
+    run_select that reuses a recent result for the same statement and
+    parameters (limit included) instead of re-running the service.
+    Errors are never cached; use_cache=False forces a live read.
+    """
+    ttl = _SNAPSHOT_TTL.get(kind, _SQL_CACHE_TTL)
+    key = (sql, tuple(parameters or ()))
+    now = _time.monotonic()
+    if use_cache and ttl > 0:
+        with _snapshot_lock:
+            hit = _snapshot_cache.get(key)
+            if hit is not None and now - hit[1] < ttl:
+                _snapshot_cache.move_to_end(key)
+                return hit[2]
+    result = run_select(sql, parameters=parameters)
+    if ttl > 0 and not result.startswith("ERROR"):
+        with _snapshot_lock:
+            _snapshot_cache[key] = (kind, now, result)
+            _snapshot_cache.move_to_end(key)
+            if len(_snapshot_cache) > _SNAPSHOT_CACHE_MAX:
+                _snapshot_cache.popitem(last=False)
+    return result
+
+
+def invalidate_select_cache(kind: Optional[str] = None) -> None:
+    """Forget cached tool results: all of them, or only those of one kind (e.g. "asp_info")."""
+    with _snapshot_lock:
+        if kind is None:
+            _snapshot_cache.clear()
+            return
+        for key in [k for k, v in _snapshot_cache.items() if v[0] == kind]:
+            del _snapshot_cache[key]
+
+
+def _select_with_limit(template: str, limit: int, default: int, max_n: int,
+                       parameters: Optional[QueryParameters] = None,
+                       fetch_size: Optional[int] = None) -> str:
+    """
+    Shared body of the list-style tools: clamp limit, bake it into the
+    template's FETCH FIRST, run the guarded SELECT.
+    """
+    lim = _safe_limit(limit, default=default, max_n=max_n)
+    return run_select(_with_limit(template, lim), parameters=parameters, fetch_size=fetch_size)
+
+
+# A column (or closing identifier quote) followed by a comparison operator,
+# at the end of the text before a literal: "COL = ", "T.COL<>", "COL LIKE "
+_BINDABLE_BEFORE_RE = re.compile(r'[A-Za-z0-9_#$@"]\s*(?:=|<>|!=|<=|>=|<|>|\bLIKE)\s*$', re.IGNORECASE)
+
+
+def _parameterize_literals(clause: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Replace the '...' string literals of a validated WHERE clause that are
+    compared directly with a column by ? markers, and return (clause,
+    literal values). Queries that differ only in the values they filter on
+    then share one SQL text (and one Db2 plan). Doubled quotes inside a
+    literal are unescaped; an unterminated quote is left untouched.
+
+    Literals stay inline where an untyped marker is invalid or would change
+    the statement: typed/hex constants (X'..', DATE '..'), literal-vs-literal
+    comparisons, and literals inside expressions (BETWEEN, ||, ESCAPE).
+
+    >>> _parameterize_literals("NAME = 'O''Brien' AND ST LIKE 'A%'")
+    ('NAME = ? AND ST LIKE ?', ("O'Brien", 'A%'))
+    >>> _parameterize_literals("CODE = X'41' AND D >= DATE '2024-01-01'")
+    ("CODE = X'41' AND D >= DATE '2024-01-01'", ())
+    >>> _parameterize_literals("'A' = 'A' OR C BETWEEN 'a' AND 'b'")
+    ("'A' = 'A' OR C BETWEEN 'a' AND 'b'", ())
+    >>> _parameterize_literals("C = 'a' || D")
+    ("C = 'a' || D", ())
+    """
+    if "'" not in clause:
+        return clause, ()
+    out: List[str] = []
+    values: List[str] = []
+    i = 0
+    n = len(clause)
+    while i < n:
+        start = clause.find("'", i)
+        if start < 0:
+            break
+        j = start + 1
+        while True:
+            j = clause.find("'", j)
+            if j < 0 or j + 1 >= n or clause[j + 1] != "'":
+                break
+            j += 2
+        if j < 0:
+            break  # unterminated literal
+        after = clause[j + 1:].lstrip()
+        bindable = (
+            (start == 0 or clause[start - 1] not in _IDENT_CHARS)  # no X/DATE/... prefix
+            and _BINDABLE_BEFORE_RE.search(clause, max(0, start - 64), start) is not None
+            and (not after or after[0] in _IDENT_CHARS)  # followed by AND/OR/end, not an operator
+        )
+        if bindable:
+            out.append(clause[i:start])
+            out.append("?")
+            values.append(clause[start + 1:j].replace("''", "'"))
+        else:
+            out.append(clause[i:j + 1])
+        i = j + 1
+    out.append(clause[i:])
+    return "".join(out), tuple(values)
+
+
+@functools.lru_cache(maxsize=256)
 def _build_user_table_query(schema: str, table: str, where_clause: str = "",
                            order_by: str = "", limit: int = 100) -> str:
     """
@@ -1088,93 +1858,111 @@ def _build_user_table_query(schema: str, table: str, where_clause: str = "",
 
 # --- Ops / Observability ---
 @tool(name="get-system-status", description="Retrieve overall IBM i system performance statistics using QSYS2.SYSTEM_STATUS.")
-def get_system_status() -> str:
-    return run_select(SYSTEM_STATUS_SQL)
+def get_system_status(use_cache: bool = True, reset: bool = False) -> str:
+    """
+    reset=True also resets the elapsed statistics (a server-side side effect;
+    meant for monitoring scripts measuring an interval). It is never cached.
+    """
+    if reset:
+        invalidate_select_cache("system_status")
+        return run_select(SYSTEM_STATUS_RESET_SQL)
+    return _snapshot_select("system_status", SYSTEM_STATUS_SQL, use_cache)
 
 @tool(name="get-system-activity", description="Retrieve current IBM i activity metrics using QSYS2.SYSTEM_ACTIVITY_INFO.")
 def get_system_activity() -> str:
     return run_select(SYSTEM_ACTIVITY_SQL)
 
+@tool(name="get-system-snapshot", description="System status and current CPU activity in one call (QSYS2.SYSTEM_STATUS joined with QSYS2.SYSTEM_ACTIVITY_INFO).")
+def get_system_snapshot() -> str:
+    return run_select(SYSTEM_SNAPSHOT_SQL)
+
 @tool(name="top-cpu-jobs", description="Show top CPU jobs using QSYS2.ACTIVE_JOB_INFO. Optional subsystem/user CSV filters.")
 def top_cpu_jobs(limit: int = 10, subsystem_csv: str = "", user_csv: str = "") -> str:
     lim = _safe_limit(limit, default=10, max_n=200)
     sbs = _safe_csv_idents(subsystem_csv, what="subsystem list") if subsystem_csv else ""
     usr = _safe_csv_idents(user_csv, what="user list") if user_csv else ""
-    return run_select(TOP_CPU_JOBS_SQL, parameters=[sbs, usr, lim])
+    return run_select(_with_limit(TOP_CPU_JOBS_SQL, lim), parameters=[sbs, usr])
+
+@tool(name="performance-triage-bundle", description="One-call performance triage: system status, top CPU jobs, MSGW jobs, disk hotspots and output queue backlogs, fetched in parallel.")
+def performance_triage_bundle(limit: int = 10) -> str:
+    lim = _safe_limit(limit, default=10, max_n=200)
+    sections = (
+        ("System Snapshot", SYSTEM_SNAPSHOT_SQL, None),
+        ("Top CPU Jobs", _with_limit(TOP_CPU_JOBS_SQL, lim), ["", ""]),
+        ("Jobs in MSGW", _with_limit(MSGW_JOBS_SQL, lim), None),
+        ("Disk Hotspots", _with_limit(DISK_HOTSPOTS_SQL, lim), None),
+        ("Output Queue Hotspots", _with_limit(OUTQ_HOTSPOTS_SQL, lim), None),
+    )
+    results = run_select_many([(sql, params) for _, sql, params in sections])
+    return "\n\n".join(f"## {title}\n{result}" for (title, _, _), result in zip(sections, results))
 
 @tool(name="jobs-in-msgw", description="List jobs in MSGW status using QSYS2.ACTIVE_JOB_INFO.")
 def jobs_in_msgw(limit: int = 50) -> str:
-    lim = _safe_limit(limit, default=50, max_n=500)
-    return run_select(MSGW_JOBS_SQL, parameters=[lim])
+    return _select_with_limit(MSGW_JOBS_SQL, limit, default=50, max_n=500)
 
 @tool(name="qsysopr-messages", description="Fetch recent QSYSOPR messages using QSYS2.MESSAGE_QUEUE_INFO.")
-def qsysopr_messages(limit: int = 50) -> str:
+def qsysopr_messages(limit: int = 50, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=50, max_n=500)
-    return run_select(QSYSOPR_RECENT_MSGS_SQL, parameters=[lim])
+    return _snapshot_select("qsysopr_messages", _with_limit(QSYSOPR_RECENT_MSGS_SQL, lim), use_cache)
 
 @tool(name="netstat-snapshot", description="Snapshot of network connections using QSYS2.NETSTAT_INFO.")
 def netstat_snapshot(limit: int = 50) -> str:
-    lim = _safe_limit(limit, default=50, max_n=1000)
-    return run_select(NETSTAT_SUMMARY_SQL, parameters=[lim])
+    return _select_with_limit(NETSTAT_SUMMARY_SQL, limit, default=50, max_n=1000)
 
 @tool(name="get-asp-info", description="Get ASP information from QSYS2.ASP_INFO.")
-def get_asp_info() -> str:
-    return run_select(ASP_INFO_SQL)
+def get_asp_info(use_cache: bool = True) -> str:
+    return _snapshot_select("asp_info", ASP_INFO_SQL, use_cache)
 
 @tool(name="disk-hotspots", description="Show disks with highest percent used using QSYS2.SYSDISKSTAT.")
-def disk_hotspots(limit: int = 10) -> str:
+def disk_hotspots(limit: int = 10, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=10, max_n=200)
-    return run_select(DISK_HOTSPOTS_SQL, parameters=[lim])
+    return _snapshot_select("disk_hotspots", _with_limit(DISK_HOTSPOTS_SQL, lim), use_cache)
 
 @tool(name="output-queue-hotspots", description="Show output queues with the most spooled files using QSYS2.OUTPUT_QUEUE_INFO.")
 def output_queue_hotspots(limit: int = 20) -> str:
-    lim = _safe_limit(limit, default=20, max_n=500)
-    return run_select(OUTQ_HOTSPOTS_SQL, parameters=[lim])
+    return _select_with_limit(OUTQ_HOTSPOTS_SQL, limit, default=20, max_n=500)
 
 @tool(name="ended-jobs", description="Show recently ended jobs using SYSTOOLS.ENDED_JOB_INFO (if available).")
 def ended_jobs(limit: int = 50) -> str:
-    lim = _safe_limit(limit, default=50, max_n=500)
-    return run_select(ENDED_JOB_INFO_SQL, parameters=[lim])
+    return _select_with_limit(ENDED_JOB_INFO_SQL, limit, default=50, max_n=500)
 
 @tool(name="job-queue-entries", description="Show job queue entries using SYSTOOLS.JOB_QUEUE_ENTRIES (if available).")
 def job_queue_entries(limit: int = 200) -> str:
-    lim = _safe_limit(limit, default=200, max_n=2000)
-    return run_select(JOB_QUEUE_ENTRIES_SQL, parameters=[lim])
+    return _select_with_limit(JOB_QUEUE_ENTRIES_SQL, limit, default=200, max_n=2000,
+                              fetch_size=_STREAM_CHUNK_ROWS)
 
 @tool(name="user-storage-top", description="Show users consuming the most storage using QSYS2.USER_STORAGE.")
-def user_storage_top(limit: int = 50) -> str:
+def user_storage_top(limit: int = 50, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=50, max_n=500)
-    return run_select(USER_STORAGE_SQL, parameters=[lim])
+    return _snapshot_select("user_storage", _with_limit(USER_STORAGE_SQL, lim), use_cache)
 
 @tool(name="ifs-largest-objects", description="List largest objects in an IFS path using QSYS2.IFS_OBJECT_STATISTICS(path).")
 def ifs_largest_objects(path: str, limit: int = 50) -> str:
     lim = _safe_limit(limit, default=50, max_n=1000)
     if not path or not path.startswith("/"):
         raise ValueError("IFS path must start with '/'.")
-    return run_select(IFS_OBJECT_STATISTICS_SQL, parameters=[path, lim])
+    return run_select(_with_limit(IFS_OBJECT_STATISTICS_SQL, lim), parameters=[path])
 
 @tool(name="objects-changed-recently", description="List objects changed in last N days using QSYS2.OBJECT_STATISTICS.")
 def objects_changed_recently(days: int = 7, limit: int = 200) -> str:
     d = _safe_limit(days, default=7, max_n=3650)
-    lim = _safe_limit(limit, default=200, max_n=2000)
-    return run_select(OBJECT_CHANGED_RECENTLY_SQL, parameters=[d, lim])
+    return _select_with_limit(OBJECT_CHANGED_RECENTLY_SQL, limit, default=200, max_n=2000, parameters=[d])
 
 # --- PTF / Inventory / Licensing ---
 @tool(name="ptfs-requiring-ipl", description="List PTFs that require an IPL using QSYS2.PTF_INFO.")
-def ptfs_requiring_ipl(limit: int = 200) -> str:
+def ptfs_requiring_ipl(limit: int = 200, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=200, max_n=2000)
-    return run_select(PTF_IPL_REQUIRED_SQL, parameters=[lim])
+    return _snapshot_select("ptfs_requiring_ipl", _with_limit(PTF_IPL_REQUIRED_SQL, lim), use_cache)
 
 @tool(name="software-products", description="List installed licensed products from QSYS2.SOFTWARE_PRODUCT_INFO. Optionally filter by product_id.")
 def software_products(product_id: str = "", limit: int = 500) -> str:
     lim = _safe_limit(limit, default=500, max_n=5000)
     pid = _safe_ident(product_id, what="product_id") if product_id else None
-    return run_select(SOFTWARE_PRODUCT_INFO_SQL, parameters=[pid, pid, lim])
+    return run_select(_with_limit(SOFTWARE_PRODUCT_INFO_SQL, lim), parameters=[pid, pid])
 
 @tool(name="license-info", description="List license info using QSYS2.LICENSE_INFO.")
 def license_info(limit: int = 200) -> str:
-    lim = _safe_limit(limit, default=200, max_n=5000)
-    return run_select(LICENSE_INFO_SQL, parameters=[lim])
+    return _select_with_limit(LICENSE_INFO_SQL, limit, default=200, max_n=5000)
 
 # --- Services discovery ---
 @tool(name="search-sql-services", description="Search IBM i SQL services catalog (QSYS2.SERVICES_INFO) by name/category keyword.")
@@ -1184,23 +1972,22 @@ def search_sql_services(keyword: str, limit: int = 100) -> str:
         raise ValueError("keyword is required")
     lim = _safe_limit(limit, default=100, max_n=5000)
     like = f"%{kw}%"
-    return run_select(SERVICES_SEARCH_SQL, parameters=[like, like, lim])
+    return run_select(_with_limit(SERVICES_SEARCH_SQL, lim), parameters=[like, like])
 
 # --- Security ---
 @tool(name="list-user-profiles", description="List IBM i user profiles (basic) using QSYS2.USER_INFO_BASIC.")
 def list_user_profiles(limit: int = 500) -> str:
-    lim = _safe_limit(limit, default=500, max_n=5000)
-    return run_select(USER_INFO_BASIC_SQL, parameters=[lim])
+    return _select_with_limit(USER_INFO_BASIC_SQL, limit, default=500, max_n=5000)
 
 @tool(name="list-privileged-profiles", description="List user profiles with authorities/invalid signons using QSYS2.USER_INFO.")
-def list_privileged_profiles(limit: int = 500) -> str:
+def list_privileged_profiles(limit: int = 500, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=500, max_n=5000)
-    return run_select(USER_INFO_PRIVILEGED_SQL, parameters=[lim])
+    return _snapshot_select("privileged_profiles", _with_limit(USER_INFO_PRIVILEGED_SQL, lim), use_cache)
 
 @tool(name="public-all-object-authority", description="List objects where *PUBLIC has *ALL authority using QSYS2.OBJECT_PRIVILEGES.")
-def public_all_object_authority(limit: int = 200) -> str:
+def public_all_object_authority(limit: int = 200, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=200, max_n=5000)
-    return run_select(PUBLIC_ALL_OBJECTS_SQL, parameters=[lim])
+    return _snapshot_select("public_all_objects", _with_limit(PUBLIC_ALL_OBJECTS_SQL, lim), use_cache)
 
 @tool(name="object-privileges", description="Show privileges for a specific object (schema/object) using QSYS2.OBJECT_PRIVILEGES.")
 def object_privileges(schema: str, object_name: str, limit: int = 2000) -> str:
@@ -1208,16 +1995,16 @@ def object_privileges(schema: str, object_name: str, limit: int = 2000) -> str:
         sch = _safe_schema(schema)
         obj = _safe_ident(object_name, what="object_name")
         lim = _safe_limit(limit, default=2000, max_n=20000)
-        return run_select(OBJECT_PRIVILEGES_FOR_OBJECT_SQL, parameters=[sch, obj, lim])
+        return run_select(_with_limit(OBJECT_PRIVILEGES_FOR_OBJECT_SQL, lim), parameters=[sch, obj])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
         return f"ERROR: {type(e).__name__}: {e}"
 
 @tool(name="authorization-lists", description="List authorization lists using QSYS2.AUTHORIZATION_LIST_INFO.")
-def authorization_lists(limit: int = 500) -> str:
+def authorization_lists(limit: int = 500, use_cache: bool = True) -> str:
     lim = _safe_limit(limit, default=500, max_n=5000)
-    return run_select(AUTH_LIST_INFO_SQL, parameters=[lim])
+    return _snapshot_select("authorization_lists", _with_limit(AUTH_LIST_INFO_SQL, lim), use_cache)
 
 @tool(name="authorization-list-entries", description="List entries in an authorization list using QSYS2.AUTHORIZATION_LIST_ENTRIES.")
 def authorization_list_entries(auth_list_lib: str, auth_list_name: str, limit: int = 5000) -> str:
@@ -1225,7 +2012,8 @@ def authorization_list_entries(auth_list_lib: str, auth_list_name: str, limit: i
         lib = _safe_ident(auth_list_lib, what="auth_list_lib")
         name = _safe_ident(auth_list_name, what="auth_list_name")
         lim = _safe_limit(limit, default=5000, max_n=50000)
-        return run_select(AUTH_LIST_ENTRIES_SQL, parameters=[lib, name, lim])
+        return run_select(_with_limit(AUTH_LIST_ENTRIES_SQL, lim), parameters=[lib, name],
+                          fetch_size=_STREAM_CHUNK_ROWS)
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1234,25 +2022,22 @@ def authorization_list_entries(auth_list_lib: str, auth_list_name: str, limit: i
 # --- SQL Performance ---
 @tool(name="plan-cache-top", description="Top SQL statements by elapsed time using QSYS2.PLAN_CACHE_STATEMENT (if available).")
 def plan_cache_top(limit: int = 50) -> str:
-    lim = _safe_limit(limit, default=50, max_n=5000)
-    return run_select(PLAN_CACHE_TOP_SQL, parameters=[lim])
+    return _select_with_limit(PLAN_CACHE_TOP_SQL, limit, default=50, max_n=5000)
 
 @tool(name="plan-cache-errors", description="SQL statements with errors/warnings using QSYS2.PLAN_CACHE_STATEMENT (if available).")
 def plan_cache_errors(limit: int = 50) -> str:
-    lim = _safe_limit(limit, default=50, max_n=5000)
-    return run_select(PLAN_CACHE_ERRORS_SQL, parameters=[lim])
+    return _select_with_limit(PLAN_CACHE_ERRORS_SQL, limit, default=50, max_n=5000)
 
 @tool(name="index-advice", description="Index recommendations using QSYS2.INDEX_ADVICE (if available).")
 def index_advice(limit: int = 200) -> str:
-    lim = _safe_limit(limit, default=200, max_n=5000)
-    return run_select(INDEX_ADVICE_SQL, parameters=[lim])
+    return _select_with_limit(INDEX_ADVICE_SQL, limit, default=200, max_n=5000)
 
 @tool(name="schema-table-stats", description="List largest tables in a schema using QSYS2.SYSTABLESTAT.")
 def schema_table_stats(schema: str, limit: int = 200) -> str:
     try:
         sch = _safe_schema(schema)
         lim = _safe_limit(limit, default=200, max_n=5000)
-        return run_select(TABLE_STATS_SQL, parameters=[sch, lim])
+        return run_select(_with_limit(TABLE_STATS_SQL, lim), parameters=[sch])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1264,7 +2049,7 @@ def table_index_stats(schema: str, table: str, limit: int = 500) -> str:
         sch = _safe_schema(schema)
         tbl = _safe_ident(table, what="table")
         lim = _safe_limit(limit, default=500, max_n=5000)
-        return run_select(INDEX_STATS_SQL, parameters=[sch, tbl, lim])
+        return run_select(_with_limit(INDEX_STATS_SQL, lim), parameters=[sch, tbl])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1272,30 +2057,35 @@ def table_index_stats(schema: str, table: str, limit: int = 500) -> str:
 
 @tool(name="lock-waits", description="Show lock waits/contenders using QSYS2.LOCK_WAITS (if available).")
 def lock_waits(limit: int = 100) -> str:
-    lim = _safe_limit(limit, default=100, max_n=5000)
-    return run_select(LOCK_WAITS_SQL, parameters=[lim])
+    return _select_with_limit(LOCK_WAITS_SQL, limit, default=100, max_n=5000)
 
 # --- HA/DR / Journaling ---
 @tool(name="journals", description="List journals and configuration using QSYS2.JOURNAL_INFO.")
 def journals(limit: int = 500) -> str:
-    lim = _safe_limit(limit, default=500, max_n=5000)
-    return run_select(JOURNAL_INFO_SQL, parameters=[lim])
+    return _select_with_limit(JOURNAL_INFO_SQL, limit, default=500, max_n=5000)
 
 @tool(name="journal-receivers", description="List journal receivers using QSYS2.JOURNAL_RECEIVER_INFO.")
 def journal_receivers(limit: int = 500) -> str:
-    lim = _safe_limit(limit, default=500, max_n=5000)
-    return run_select(JOURNAL_RECEIVER_INFO_SQL, parameters=[lim])
+    return _select_with_limit(JOURNAL_RECEIVER_INFO_SQL, limit, default=500, max_n=5000)
 
 # --- Integration (REST) ---
+_URL_RE = re.compile(r"https?://")
+
+
+def _is_http_url(url: str) -> bool:
+    """True when url starts with http:// or https:// (one anchored match)."""
+    return bool(url) and _URL_RE.match(url) is not None
+
+
 @tool(name="http-get-verbose", description="Call an HTTP GET using QSYS2.HTTP_GET_VERBOSE(url).")
 def http_get_verbose(url: str) -> str:
-    if not url or not (url.startswith("http://") or url.startswith("https://")):
+    if not _is_http_url(url):
         raise ValueError("url must start with http:// or https://")
     return run_select(HTTP_GET_VERBOSE_SQL, parameters=[url])
 
 @tool(name="http-post-verbose", description="Call an HTTP POST using QSYS2.HTTP_POST_VERBOSE(url, body).")
 def http_post_verbose(url: str, body: str) -> str:
-    if not url or not (url.startswith("http://") or url.startswith("https://")):
+    if not _is_http_url(url):
         raise ValueError("url must start with http:// or https://")
     body = body or ""
     return run_select(HTTP_POST_VERBOSE_SQL, parameters=[url, body])
@@ -1303,7 +2093,7 @@ def http_post_verbose(url: str, body: str) -> str:
 @tool(name="http-patch-verbose", description="Call an HTTP PATCH using QSYS2.HTTP_PATCH_VERBOSE(url, body) (7.4 TR5+).")
 def http_patch_verbose(url: str, body: str) -> str:
     """HTTP PATCH request - useful for partial resource updates."""
-    if not url or not (url.startswith("http://") or url.startswith("https://")):
+    if not _is_http_url(url):
         return "ERROR: URL must start with http:// or https://"
     body = body or ""
     if not service_exists("QSYS2", "HTTP_PATCH_VERBOSE"):
@@ -1313,7 +2103,7 @@ def http_patch_verbose(url: str, body: str) -> str:
 @tool(name="http-delete-verbose", description="Call an HTTP DELETE using QSYS2.HTTP_DELETE_VERBOSE(url) (7.4 TR5+).")
 def http_delete_verbose(url: str) -> str:
     """HTTP DELETE request - useful for resource deletion."""
-    if not url or not (url.startswith("http://") or url.startswith("https://")):
+    if not _is_http_url(url):
         return "ERROR: URL must start with http:// or https://"
     if not service_exists("QSYS2", "HTTP_DELETE_VERBOSE"):
         return "ERROR: HTTP_DELETE_VERBOSE not available. Requires IBM i 7.4 TR5+ or 7.5+."
@@ -1338,8 +2128,7 @@ def db_transaction_info(limit: int = 100) -> str:
     """
     if not service_exists("QSYS2", "DB_TRANSACTION_INFO"):
         return "ERROR: DB_TRANSACTION_INFO not available. Requires IBM i 7.4+."
-    lim = _safe_limit(limit, default=100, max_n=1000)
-    return run_select(DB_TRANSACTION_INFO_SQL, parameters=[lim])
+    return _select_with_limit(DB_TRANSACTION_INFO_SQL, limit, default=100, max_n=1000)
 
 @tool(name="active-jobs-detailed", description="Show active jobs with enhanced details (QRO hash, SQL text) using DETAILED_INFO='WORK'.")
 def active_jobs_detailed(limit: int = 50) -> str:
@@ -1347,8 +2136,7 @@ def active_jobs_detailed(limit: int = 50) -> str:
     Returns active jobs with work management focused columns including SQL statement text.
     Faster than 'ALL' and includes key performance metrics.
     """
-    lim = _safe_limit(limit, default=50, max_n=500)
-    return run_select(ACTIVE_JOBS_DETAILED_SQL, parameters=[lim])
+    return _select_with_limit(ACTIVE_JOBS_DETAILED_SQL, limit, default=50, max_n=500)
 
 @tool(name="netstat-job-info", description="Show network connections with owning job information using QSYS2.NETSTAT_JOB_INFO.")
 def netstat_job_info(limit: int = 100) -> str:
@@ -1358,8 +2146,7 @@ def netstat_job_info(limit: int = 100) -> str:
     """
     if not service_exists("QSYS2", "NETSTAT_JOB_INFO"):
         return "ERROR: NETSTAT_JOB_INFO not available. Requires IBM i 7.4+."
-    lim = _safe_limit(limit, default=100, max_n=1000)
-    return run_select(NETSTAT_JOB_INFO_SQL, parameters=[lim])
+    return _select_with_limit(NETSTAT_JOB_INFO_SQL, limit, default=100, max_n=1000)
 
 @tool(name="joblog-info", description="Read job log messages for a specific job using QSYS2.JOBLOG_INFO.")
 def joblog_info(job_name: str, min_severity: int = 20, limit: int = 100) -> str:
@@ -1376,7 +2163,7 @@ def joblog_info(job_name: str, min_severity: int = 20, limit: int = 100) -> str:
         job = job_name.strip() if job_name else "*"
         sev = max(0, min(99, int(min_severity)))
         lim = _safe_limit(limit, default=100, max_n=1000)
-        return run_select(JOBLOG_INFO_SQL, parameters=[job, sev, lim])
+        return run_select(_with_limit(JOBLOG_INFO_SQL, lim), parameters=[job, sev])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1390,8 +2177,7 @@ def spooled_file_info(limit: int = 100) -> str:
     """
     if not service_exists("QSYS2", "SPOOLED_FILE_INFO"):
         return "ERROR: SPOOLED_FILE_INFO not available. Requires IBM i 7.4+."
-    lim = _safe_limit(limit, default=100, max_n=1000)
-    return run_select(SPOOLED_FILE_INFO_SQL, parameters=[lim])
+    return _select_with_limit(SPOOLED_FILE_INFO_SQL, limit, default=100, max_n=1000)
 
 @tool(name="ifs-object-stats", description="Show IFS (Integrated File System) object statistics using QSYS2.IFS_OBJECT_STATISTICS.")
 def ifs_object_stats(start_path: str = "/", min_size_bytes: int = 1048576, limit: int = 100) -> str:
@@ -1408,7 +2194,7 @@ def ifs_object_stats(start_path: str = "/", min_size_bytes: int = 1048576, limit
         path = start_path.strip() if start_path else "/"
         min_size = max(0, int(min_size_bytes))
         lim = _safe_limit(limit, default=100, max_n=1000)
-        return run_select(IFS_OBJECT_STATISTICS_SQL, parameters=[path, min_size, lim])
+        return run_select(_with_limit(IFS_OBJECT_STATISTICS_SQL, lim), parameters=[path, min_size])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1441,7 +2227,7 @@ def system_values(filter_pattern: str = "*ALL", limit: int = 200) -> str:
         # Convert *ALL to SQL wildcard
         sql_pattern = "%" if pattern == "*ALL" else pattern.replace("*", "%")
         lim = _safe_limit(limit, default=200, max_n=1000)
-        return run_select(SYSTEM_VALUE_INFO_SQL, parameters=[pattern, sql_pattern, lim])
+        return run_select(_with_limit(SYSTEM_VALUE_INFO_SQL, lim), parameters=[pattern, sql_pattern])
     except Exception as e:
         return f"ERROR: {type(e).__name__}: {e}"
 
@@ -1461,8 +2247,7 @@ def hardware_resource_info(limit: int = 200) -> str:
     """
     if not service_exists("QSYS2", "HARDWARE_RESOURCE_INFO"):
         return "ERROR: HARDWARE_RESOURCE_INFO not available. Requires IBM i 7.3+."
-    lim = _safe_limit(limit, default=200, max_n=1000)
-    return run_select(HARDWARE_RESOURCE_INFO_SQL, parameters=[lim])
+    return _select_with_limit(HARDWARE_RESOURCE_INFO_SQL, limit, default=200, max_n=1000)
 
 # --- Library / Object sizing ---
 @tool(name="largest-objects", description="Find largest objects in a library using QSYS2.OBJECT_STATISTICS.")
@@ -1470,17 +2255,29 @@ def largest_objects(library: str, limit: int = 50) -> str:
     try:
         lib = _safe_ident_or_special(library, what="library")
         lim = _safe_limit(limit, default=50, max_n=5000)
-        return run_select(LARGEST_OBJECTS_SQL, parameters=[lib, lim])
+        return run_select(_with_limit(LARGEST_OBJECTS_SQL, lim), parameters=[lib])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
         return f"ERROR: {type(e).__name__}: {e}"
 
-@tool(name="library-sizes", description="List libraries and their sizes using QSYS2.LIBRARY_INFO. Can exclude system libraries.")
-def library_sizes(limit: int = 100, exclude_system: bool = False) -> str:
+@tool(name="library-sizes", description="List libraries and their sizes using QSYS2.LIBRARY_INFO. Can exclude system libraries; fast=True sizes only the libraries with the most objects.")
+def library_sizes(limit: int = 100, exclude_system: bool = False, use_cache: bool = True,
+                  fast: bool = False) -> str:
+    """
+    Sizing every library is slow on systems with thousands of them.
+    fast=True first ranks libraries by object count and sizes only the top
+    limit x 4; the result is approximate (few-but-huge libraries can be missed).
+    """
     lim = _safe_limit(limit, default=100, max_n=20000)
-    sql = LIBRARY_SIZES_EXCL_SYSTEM_SQL if exclude_system else LIBRARY_SIZES_ALL_SQL
-    return run_select(sql, parameters=[lim])
+    if fast:
+        sql = LIBRARY_SIZES_CANDIDATES_SQL.format(
+            exclude=_LIBRARY_SIZES_EXCLUDE_SYSTEM if exclude_system else "",
+            candidates=lim * _LIBRARY_SIZE_CANDIDATE_FACTOR,
+        )
+    else:
+        sql = LIBRARY_SIZES_EXCL_SYSTEM_SQL if exclude_system else LIBRARY_SIZES_ALL_SQL
+    return _snapshot_select("library_sizes", _with_limit(sql, lim), use_cache)
 
 # --- Data Governance / Metadata ---
 @tool(name="list-tables-in-schema", description="List tables/views in a schema using QSYS2.SYSTABLES.")
@@ -1488,7 +2285,8 @@ def list_tables_in_schema(schema: str, limit: int = 5000) -> str:
     try:
         sch = _safe_schema(schema)
         lim = _safe_limit(limit, default=5000, max_n=50000)
-        return run_select(SYSTABLES_IN_SCHEMA_SQL, parameters=[sch, lim])
+        return run_select(_with_limit(SYSTABLES_IN_SCHEMA_SQL, lim), parameters=[sch],
+                          fetch_size=_STREAM_CHUNK_ROWS)
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1500,7 +2298,8 @@ def describe_table(schema: str, table: str, limit: int = 5000) -> str:
         sch = _safe_schema(schema)
         tbl = _safe_ident(table, what="table")
         lim = _safe_limit(limit, default=5000, max_n=50000)
-        return run_select(SYSCOLUMNS_FOR_TABLE_SQL, parameters=[sch, tbl, lim])
+        return run_select(_with_limit(SYSCOLUMNS_FOR_TABLE_SQL, lim), parameters=[sch, tbl],
+                          fetch_size=_STREAM_CHUNK_ROWS)
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1511,111 +2310,229 @@ def list_routines_in_schema(schema: str, limit: int = 2000) -> str:
     try:
         sch = _safe_schema(schema)
         lim = _safe_limit(limit, default=2000, max_n=50000)
-        return run_select(SYSROUTINES_IN_SCHEMA_SQL, parameters=[sch, lim])
+        return run_select(_with_limit(SYSROUTINES_IN_SCHEMA_SQL, lim), parameters=[sch])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
         return f"ERROR: {type(e).__name__}: {e}"
 
 # --- Logging (optional write tool) ---
-@tool(name="log-performance-metrics", description="Save performance metrics to SAMPLE.METRICS for trend history (requires table).")
-def log_performance_metrics(cpu_usage: float, asp_usage: float) -> str:
-    sql = """
-        INSERT INTO SAMPLE.METRICS (TS, CPU_PCT, ASP_PCT)
-        VALUES (CURRENT_TIMESTAMP, ?, ?)
-    """
+# Samples are queued and written as multi-row INSERTs by a background thread,
+# so a dashboard sampling every second does not pay one round-trip per sample.
+_METRICS_ROW = "(CAST(? AS TIMESTAMP), ?, ?)"
+_METRICS_FLUSH_SECS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+_METRICS_MAX_BATCH = 500
+
+_metrics_queue: "queue.Queue[Tuple[str, float, float]]" = queue.Queue()
+_metrics_flush_lock = threading.Lock()
+_metrics_thread_lock = threading.Lock()
+_metrics_thread: Optional[threading.Thread] = None
+# Samples kept for retry while inserts fail (e.g. SAMPLE.METRICS missing)
+_METRICS_MAX_QUEUED = 100_000
+# Error text of the last failed flush, reported by the next tool call; cleared on success
+_metrics_last_error: Optional[str] = None
+
+
+def _flush_metrics() -> str:
+    """
+    Drain the queue and INSERT the samples, up to _METRICS_MAX_BATCH rows per
+    statement. On failure the unwritten samples are put back (up to
+    _METRICS_MAX_QUEUED), the error is remembered for the next
+    log_performance_metrics call, and the exception propagates.
+    """
+    global _metrics_last_error
+    with _metrics_flush_lock:
+        rows: List[Tuple[str, float, float]] = []
+        while True:
+            try:
+                rows.append(_metrics_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            return "No queued metrics."
+        results = []
+        for start in range(0, len(rows), _METRICS_MAX_BATCH):
+            batch = rows[start:start + _METRICS_MAX_BATCH]
+            sql = METRICS_INSERT_SQL.format(values=", ".join([_METRICS_ROW] * len(batch)))
+            try:
+                results.append(run_sql_statement(
+                    sql, parameters=[v for row in batch for v in row], retry=False))
+            except Exception as e:
+                _metrics_last_error = f"{type(e).__name__}: {e}"
+                unwritten = rows[start:]
+                room = max(0, _METRICS_MAX_QUEUED - _metrics_queue.qsize())
+                for row in unwritten[-room:] if room else ():
+                    _metrics_queue.put(row)
+                if len(unwritten) > room:
+                    print(f"[METRICS] Queue full, dropped {len(unwritten) - room} oldest samples", file=sys.stderr)
+                raise
+        _metrics_last_error = None
+        return "\n".join(results)
+
+
+def _metrics_flush_loop() -> None:
+    while True:
+        _time.sleep(_METRICS_FLUSH_SECS)
+        try:
+            _flush_metrics()
+        except Exception as e:
+            print(f"[METRICS] Flush failed, samples kept for retry: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+def _ensure_metrics_thread() -> None:
+    global _metrics_thread
+    with _metrics_thread_lock:
+        if _metrics_thread is None:
+            _metrics_thread = threading.Thread(target=_metrics_flush_loop, name="metrics-flush", daemon=True)
+            _metrics_thread.start()
+
+
+@atexit.register
+def _flush_metrics_at_exit() -> None:
+    # Registered after _close_pool, so it runs first (atexit is LIFO)
     try:
-        return run_sql_statement(sql, parameters=[cpu_usage, asp_usage])
+        _flush_metrics()
     except Exception as e:
-        return f"ERROR inserting metrics. Details: {type(e).__name__}: {e}"
+        print(f"[METRICS] final flush failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+@tool(name="log-performance-metrics", description="Save performance metrics to SAMPLE.METRICS for trend history (requires table).")
+def log_performance_metrics(cpu_usage: float, asp_usage: float, flush: bool = False) -> str:
+    """
+    Queues one sample; queued samples are written every METRICS_FLUSH_SECONDS
+    (default 5) in a single multi-row INSERT. TS is the time of this call.
+    flush=True writes everything queued now and returns the INSERT result.
+    If the last background write failed, its error is returned (the sample
+    is still queued; failed samples are retried).
+    """
+    ts = datetime.now().strftime("%Y-%m-%d-%H.%M.%S.%f")
+    _metrics_queue.put((ts, cpu_usage, asp_usage))
+    if flush:
+        try:
+            return _flush_metrics()
+        except Exception as e:
+            return f"ERROR inserting metrics. Details: {type(e).__name__}: {e}"
+    _ensure_metrics_thread()
+    last_error = _metrics_last_error
+    if last_error is not None:
+        return (f"ERROR inserting metrics (samples kept queued for retry, "
+                f"{_metrics_queue.qsize()} pending). Details: {last_error}")
+    return f"Metrics queued; written to SAMPLE.METRICS within {_METRICS_FLUSH_SECS:g}s."
 
 # --- Runbook / Checklist tools ---
+# (aliases, title, bullets); rendered once at import and looked up per alias.
+_RUNBOOK_TEMPLATES: Tuple[Tuple[FrozenSet[str], str, Tuple[str, ...]], ...] = (
+    (
+        frozenset({"dr", "disaster recovery", "recovery"}),
+        "IBM i Disaster Recovery Runbook (Template)",
+        (
+            "Define scope: partitions, IASPs, apps, integrations",
+            "RPO/RTO targets and success criteria",
+            "Failover decision and approvals",
+            "Backup validation + last good restore point",
+            "Switchover steps + DNS/IP considerations",
+            "Post-recovery validation (jobs, apps, interfaces)",
+            "Audit log capture and incident report",
+        ),
+    ),
+    (
+        frozenset({"switchover", "ha switchover", "failover"}),
+        "IBM i HA Switchover Runbook (Template)",
+        (
+            "Pre-check: replication health + journal receiver lag",
+            "Freeze non-essential batch and quiesce critical subsystems",
+            "Execute planned switchover (PowerHA/replication steps)",
+            "Validate Db2 and application connectivity",
+            "Resume workloads and monitor for errors",
+            "Document timings and update SOP",
+        ),
+    ),
+)
+
+_CHECKLIST_TEMPLATES: Tuple[Tuple[FrozenSet[str], str, Tuple[str, ...]], ...] = (
+    (
+        frozenset({"release", "deployment", "devops"}),
+        "IBM i Release/Deployment Checklist",
+        (
+            "Confirm change approval and maintenance window",
+            "Compare PTF level and environment drift",
+            "Validate object authority and ownership expectations",
+            "Promote objects in correct dependency order",
+            "Run smoke tests + critical business flows",
+            "Monitor QSYSOPR + job logs for spikes",
+            "Rollback plan ready and rehearsed",
+        ),
+    ),
+    (
+        frozenset({"security", "compliance"}),
+        "IBM i Security Posture Checklist",
+        (
+            "Review privileged profiles (*ALLOBJ/*SECADM etc.)",
+            "Check *PUBLIC authorities on sensitive objects",
+            "Confirm auditing is enabled for required event types",
+            "Validate MFA coverage for admin profiles (if applicable)",
+            "Review invalid sign-on attempts and lockouts",
+            "Verify TLS configs and disallow insecure host servers",
+        ),
+    ),
+    (
+        frozenset({"performance", "triage"}),
+        "IBM i Performance Triage Checklist",
+        (
+            "Check system status (CPU, memory, disk/ASP)",
+            "Identify top CPU jobs and their SQL statements",
+            "Check MSGW jobs and QSYSOPR messages",
+            "Inspect lock waits and contention hotspots",
+            "Check disk hotspots and output queue backlogs",
+            "Capture evidence and recommend next actions",
+        ),
+    ),
+)
+
+
+def _index_templates(
+    templates: Tuple[Tuple[FrozenSet[str], str, Tuple[str, ...]], ...]
+) -> Dict[str, str]:
+    """Map every alias to its pre-rendered template text."""
+    index: Dict[str, str] = {}
+    for aliases, title, bullets in templates:
+        rendered = _render_template(title, bullets)
+        for alias in aliases:
+            index[alias] = rendered
+    return index
+
+
+_RUNBOOKS: Dict[str, str] = _index_templates(_RUNBOOK_TEMPLATES)
+_CHECKLISTS: Dict[str, str] = _index_templates(_CHECKLIST_TEMPLATES)
+
+
 @tool(name="generate-runbook", description="Generate a runbook template for common IBM i scenarios (DR drill, switchover, incident response).")
 def generate_runbook(runbook_type: str) -> str:
-    t = (runbook_type or "").strip().lower()
-    if t in {"dr", "disaster recovery", "recovery"}:
-        return _render_template(
-            "IBM i Disaster Recovery Runbook (Template)",
-            [
-                "Define scope: partitions, IASPs, apps, integrations",
-                "RPO/RTO targets and success criteria",
-                "Failover decision and approvals",
-                "Backup validation + last good restore point",
-                "Switchover steps + DNS/IP considerations",
-                "Post-recovery validation (jobs, apps, interfaces)",
-                "Audit log capture and incident report",
-            ],
-        )
-    if t in {"switchover", "ha switchover", "failover"}:
-        return _render_template(
-            "IBM i HA Switchover Runbook (Template)",
-            [
-                "Pre-check: replication health + journal receiver lag",
-                "Freeze non-essential batch and quiesce critical subsystems",
-                "Execute planned switchover (PowerHA/replication steps)",
-                "Validate Db2 and application connectivity",
-                "Resume workloads and monitor for errors",
-                "Document timings and update SOP",
-            ],
-        )
+    rendered = _RUNBOOKS.get((runbook_type or "").strip().lower())
+    if rendered is not None:
+        return rendered
     return _render_template(
         f"Runbook Template: {runbook_type}",
-        [
+        (
             "Objective and scope",
             "Pre-checks and prerequisites",
             "Step-by-step procedure",
             "Validation steps",
             "Rollback steps",
             "Post-incident documentation",
-        ],
+        ),
     )
 
 @tool(name="generate-checklist", description="Generate checklists for releases, security posture, performance triage, or integration cutovers.")
 def generate_checklist(checklist_type: str) -> str:
-    t = (checklist_type or "").strip().lower()
-    if t in {"release", "deployment", "devops"}:
-        return _render_template(
-            "IBM i Release/Deployment Checklist",
-            [
-                "Confirm change approval and maintenance window",
-                "Compare PTF level and environment drift",
-                "Validate object authority and ownership expectations",
-                "Promote objects in correct dependency order",
-                "Run smoke tests + critical business flows",
-                "Monitor QSYSOPR + job logs for spikes",
-                "Rollback plan ready and rehearsed",
-            ],
-        )
-    if t in {"security", "compliance"}:
-        return _render_template(
-            "IBM i Security Posture Checklist",
-            [
-                "Review privileged profiles (*ALLOBJ/*SECADM etc.)",
-                "Check *PUBLIC authorities on sensitive objects",
-                "Confirm auditing is enabled for required event types",
-                "Validate MFA coverage for admin profiles (if applicable)",
-                "Review invalid sign-on attempts and lockouts",
-                "Verify TLS configs and disallow insecure host servers",
-            ],
-        )
-    if t in {"performance", "triage"}:
-        return _render_template(
-            "IBM i Performance Triage Checklist",
-            [
-                "Check system status (CPU, memory, disk/ASP)",
-                "Identify top CPU jobs and their SQL statements",
-                "Check MSGW jobs and QSYSOPR messages",
-                "Inspect lock waits and contention hotspots",
-                "Check disk hotspots and output queue backlogs",
-                "Capture evidence and recommend next actions",
-            ],
-        )
+    rendered = _CHECKLISTS.get((checklist_type or "").strip().lower())
+    if rendered is not None:
+        return rendered
     return _render_template(
         f"Checklist: {checklist_type}",
-        ["Define objective", "Gather evidence", "Execute steps", "Validate outcome", "Document results"],
+        ("Define objective", "Gather evidence", "Execute steps", "Validate outcome", "Document results"),
     )
 
-
 # =============================================================================
 # IBM i 7.6 SERVICES (NEW TOOLS)
 # =============================================================================
@@ -1629,8 +2546,7 @@ def ifs_authority_collection(path_pattern: str = "%", limit: int = 200) -> str:
     if not service_exists("QSYS2", "AUTHORITY_COLLECTION_IFS"):
         return "ERROR: AUTHORITY_COLLECTION_IFS not available. Requires IBM i 7.6 or 7.5 TR6+."
 
-    lim = _safe_limit(limit, default=200, max_n=5000)
-    return run_select(AUTHORITY_COLLECTION_IFS_SQL, parameters=[path_pattern, lim])
+    return _select_with_limit(AUTHORITY_COLLECTION_IFS_SQL, limit, default=200, max_n=5000, parameters=[path_pattern])
 
 
 @tool(name="verify-name", description="Validate system or SQL name using QSYS2.VERIFY_NAME (7.6/7.5 TR6+).")
@@ -1678,8 +2594,7 @@ def certificate_usage_info(store_pattern: str = "%", limit: int = 100) -> str:
     if not service_exists("SYSTOOLS", "CERTIFICATE_USAGE_INFO"):
         return "ERROR: CERTIFICATE_USAGE_INFO not available. Requires IBM i 7.5 TR1+."
 
-    lim = _safe_limit(limit, default=100, max_n=5000)
-    return run_select(CERTIFICATE_USAGE_INFO_SQL, parameters=[store_pattern, lim])
+    return _select_with_limit(CERTIFICATE_USAGE_INFO_SQL, limit, default=100, max_n=5000, parameters=[store_pattern])
 
 
 @tool(name="user-mfa-settings", description="Show MFA/TOTP settings for user profiles using QSYS2.USER_INFO (7.6/7.5 TR6+).")
@@ -1691,10 +2606,10 @@ def user_mfa_settings(user_profile: str = "*ALL", limit: int = 500) -> str:
     lim = _safe_limit(limit, default=500, max_n=5000)
 
     if user_profile.upper() == "*ALL":
-        return run_select(USER_MFA_INFO_SQL, parameters=["*ALL", "", lim])
+        return run_select(_with_limit(USER_MFA_INFO_SQL, lim), parameters=["*ALL", ""])
     else:
         usr = _safe_ident(user_profile, what="user_profile")
-        return run_select(USER_MFA_INFO_SQL, parameters=[usr, usr, lim])
+        return run_select(_with_limit(USER_MFA_INFO_SQL, lim), parameters=[usr, usr])
 
 
 @tool(name="subsystem-routing-info", description="Show subsystem routing entries using QSYS2.SUBSYSTEM_ROUTING_INFO (7.6).")
@@ -1709,9 +2624,9 @@ def subsystem_routing_info(subsystem: str = "", limit: int = 500) -> str:
 
     if subsystem:
         sbs = _safe_ident(subsystem, what="subsystem")
-        return run_select(SUBSYSTEM_ROUTING_INFO_SQL, parameters=[sbs, sbs, lim])
+        return run_select(_with_limit(SUBSYSTEM_ROUTING_INFO_SQL, lim), parameters=[sbs, sbs])
     else:
-        return run_select(SUBSYSTEM_ROUTING_INFO_SQL, parameters=[None, None, lim])
+        return run_select(_with_limit(SUBSYSTEM_ROUTING_INFO_SQL, lim), parameters=[None, None])
 
 @tool(name="active-jobs-full", description="Fast active job query excluding slow columns using DETAILED_INFO='FULL' (7.6).")
 def active_jobs_full(limit: int = 100) -> str:
@@ -1720,8 +2635,7 @@ def active_jobs_full(limit: int = 100) -> str:
     Faster than 'ALL' or 'WORK' for quick job snapshots.
     Requires IBM i 7.6 or specific PTF on 7.5.
     """
-    lim = _safe_limit(limit, default=100, max_n=1000)
-    return run_select(ACTIVE_JOBS_FULL_SQL, parameters=[lim])
+    return _select_with_limit(ACTIVE_JOBS_FULL_SQL, limit, default=100, max_n=1000)
 
 @tool(name="disk-block-size-info", description="Show disk configuration with block size info using QSYS2.SYSDISKSTAT.")
 def disk_block_size_info(limit: int = 100) -> str:
@@ -1729,8 +2643,7 @@ def disk_block_size_info(limit: int = 100) -> str:
     Returns disk unit statistics including capacity, usage, and protection settings.
     Useful for storage planning and identifying disk hotspots.
     """
-    lim = _safe_limit(limit, default=100, max_n=500)
-    return run_select(DISK_BLOCK_SIZE_SQL, parameters=[lim])
+    return _select_with_limit(DISK_BLOCK_SIZE_SQL, limit, default=100, max_n=500)
 
 @tool(name="subsystem-pool-info", description="Show memory pool allocations for subsystems using QSYS2.SUBSYSTEM_POOL_INFO.")
 def subsystem_pool_info(limit: int = 200) -> str:
@@ -1740,8 +2653,7 @@ def subsystem_pool_info(limit: int = 200) -> str:
     """
     if not service_exists("QSYS2", "SUBSYSTEM_POOL_INFO"):
         return "ERROR: SUBSYSTEM_POOL_INFO not available. Requires IBM i 7.4+."
-    lim = _safe_limit(limit, default=200, max_n=1000)
-    return run_select(SUBSYSTEM_POOL_INFO_SQL, parameters=[lim])
+    return _select_with_limit(SUBSYSTEM_POOL_INFO_SQL, limit, default=200, max_n=1000)
 
 @tool(name="ptf-supersession", description="Show PTFs that have been superseded using QSYS2.PTF_INFO.")
 def ptf_supersession(limit: int = 200) -> str:
@@ -1749,8 +2661,7 @@ def ptf_supersession(limit: int = 200) -> str:
     Returns PTFs that have been superseded by newer PTFs.
     Useful for PTF cleanup and ensuring you're running the latest fixes.
     """
-    lim = _safe_limit(limit, default=200, max_n=1000)
-    return run_select(PTF_SUPERSESSION_SQL, parameters=[lim])
+    return _select_with_limit(PTF_SUPERSESSION_SQL, limit, default=200, max_n=1000)
 
 
 # =============================================================================
@@ -1769,39 +2680,69 @@ def get_program_source_info(library: str, program: str, limit: int = 10) -> str:
         lib = _safe_ident_or_special(library, what="library")
         pgm = _safe_ident(program, what="program")
         lim = _safe_limit(limit, default=10, max_n=100)
-        return run_select(PROGRAM_SOURCE_INFO_SQL, parameters=[lib, pgm, lim])
+        return run_select(_with_limit(PROGRAM_SOURCE_INFO_SQL, lim), parameters=[lib, pgm])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
         return f"ERROR: {type(e).__name__}: {e}"
 
 
-@tool(name="read-source-member", description="Read source code from a source physical file member.")
-def read_source_member(library: str, source_file: str, member: str, limit: int = 1000) -> str:
+# SRCSEQ values in formatted source output (the last one is the next-page
+# cursor): a JSON "SRCSEQ" key, or the first cell of a table/TSV row
+_SRCSEQ_RE = re.compile(
+    r'"SRCSEQ":\s*"?([0-9]+(?:\.[0-9]+)?)|^\|?\s*([0-9]+(?:\.[0-9]+)?)\s*[|\t]',
+    re.MULTILINE,
+)
+
+
+@tool(name="read-source-member", description="Read source code from a source physical file member. Pass NEXT_CURSOR back as start_seq to read the next page.")
+def read_source_member(library: str, source_file: str, member: str, limit: int = 1000,
+                       start_seq: float = 0) -> str:
     """
     Reads actual source code lines from a source physical file member.
-    Returns up to 'limit' lines of source code.
+    Returns up to 'limit' lines of source code after sequence number 'start_seq'.
+    When more lines may follow, the response ends with NEXT_CURSOR=<SRCSEQ> of
+    the last line shown; pass it back as start_seq to continue without
+    re-reading earlier lines. No NEXT_CURSOR means the member has been read.
 
     SAFETY: This respects schema whitelist - source file must be in allowed schema.
     """
     try:
-        lib = _safe_schema(library)  # Validates against whitelist
+        lib = _safe_schema(library)
+        if lib not in _ALLOWED_SCHEMAS:
+            return f"ERROR: Schema {lib} is not in allowed schemas."
+
         srcf = _safe_ident(source_file, what="source_file")
         mbr = _safe_ident(member, what="member")
         lim = _safe_limit(limit, default=1000, max_n=10000)
+        try:
+            after = float(start_seq or 0)
+        except (TypeError, ValueError):
+            after = 0.0
 
         # Log if reading from user schema
         if lib in _USER_SCHEMAS:
             print(f"[USER_SCHEMA_ACCESS] Reading source: {lib}/{srcf}({mbr})", file=sys.stderr)
 
-        # Get member metadata
-        metadata = run_select(SOURCE_MEMBER_INFO_SQL, parameters=[lib, srcf, mbr])
-
-        # Read source lines
-        sql = f"SELECT SRCSEQ, SRCDAT, SRCDTA FROM {lib}.{srcf} ORDER BY SRCSEQ FETCH FIRST {lim} ROWS ONLY"
-        source = run_select(sql)
-
-        return f"=== Member Metadata ===\n{metadata}\n\n=== Source Code ===\n{source}"
+        # Member metadata and source lines over one connection
+        # SRCSEQ range predicate, so later pages do not rescan from line 1
+        sql = (f"SELECT SRCSEQ, SRCDAT, SRCDTA FROM {lib}.{srcf} WHERE SRCSEQ > ? "
+               f"ORDER BY SRCSEQ FETCH FIRST {lim} ROWS ONLY WITH UR")
+        metadata, source = run_select_batch([
+            (SOURCE_MEMBER_INFO_SQL, [lib, srcf, mbr], None),
+            (sql, [after], min(lim, 1000)),
+        ])
+
+        out = f"=== Member Metadata ===\n{metadata}\n\n=== Source Code ===\n{source}"
+        seqs = [j or t for j, t in _SRCSEQ_RE.findall(source)]
+        # A short, uncut page means the member is exhausted
+        more = len(seqs) >= lim or _TRUNCATED_NOTE in source
+        if source.endswith(_SIZE_CUT_NOTE):
+            # Last row is incomplete; resume at it rather than past it
+            seqs = seqs[:-1]
+        if more and seqs:
+            out += f"\n\nNEXT_CURSOR={seqs[-1]}"
+        return out
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1821,7 +2762,7 @@ def analyze_program_dependencies(library: str, program: str, limit: int = 500) -
         pgm = _safe_ident(program, what="program")
         lim = _safe_limit(limit, default=500, max_n=5000)
 
-        return run_select(PROGRAM_REFERENCES_SQL, parameters=[lib, pgm, lim])
+        return run_select(_with_limit(PROGRAM_REFERENCES_SQL, lim), parameters=[lib, pgm])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1846,20 +2787,25 @@ def query_user_table(schema: str, table: str, where_clause: str = "",
     - "customers by revenue":
       schema=CUSTLIB, table=CUSTOMERS, order_by="TOTAL_REVENUE DESC", limit=100
 
+    PERFORMANCE: keep each filtered column alone on one side of its comparison
+    so Db2 can probe an index - "ORDER_DATE >= CURRENT_DATE - 7 DAYS", not
+    "ORDER_DATE + 7 DAYS >= CURRENT_DATE"; prefer "COL BETWEEN a AND b" or
+    "COL IN ..." over ORed equalities. The limit is applied after ORDER BY.
+
     SAFETY: Only works if schema is in ALLOWED_USER_SCHEMAS environment variable.
     """
     try:
         sch = _safe_schema(schema)
-        tbl = _safe_ident(table, what="table")
-        lim = _safe_limit(limit, default=100, max_n=5000)
 
-        # Verify schema is in whitelist
+        # Verify schema is in whitelist before validating anything else
         if sch not in _ALLOWED_SCHEMAS:
             return f"ERROR: Schema {sch} is not in allowed schemas. " \
-                   f"System schemas: {sorted(_SYSTEM_SCHEMAS)}. " \
-                   f"User schemas: {sorted(_USER_SCHEMAS)}. " \
+                   f"{_SCHEMAS_HINT_TEXT} " \
                    f"To enable: Set ALLOWED_USER_SCHEMAS={sch} in .env"
 
+        tbl = _safe_ident(table, what="table")
+        lim = _safe_limit(limit, default=100, max_n=5000)
+
         # Validate WHERE and ORDER BY clauses (prevents subqueries, injection)
         where_clause = _validate_simple_clause(where_clause, "WHERE")
         order_by = _validate_simple_clause(order_by, "ORDER BY")
@@ -1869,10 +2815,12 @@ def query_user_table(schema: str, table: str, where_clause: str = "",
             print(f"[USER_SCHEMA_ACCESS] Query: {sch}.{tbl}, WHERE={where_clause}, ORDER BY={order_by}, LIMIT={lim}",
                   file=sys.stderr)
 
-        # Build dynamic query
-        sql = _build_user_table_query(sch, tbl, where_clause, order_by, lim)
+        # Build dynamic query; string literals become bind parameters so the
+        # statement text depends only on the shape of the filter
+        where_shape, where_values = _parameterize_literals(where_clause)
+        sql = _build_user_table_query(sch, tbl, where_shape, order_by, lim)
 
-        return run_select(sql)
+        return run_select(sql, parameters=list(where_values) or None)
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1887,39 +2835,55 @@ def describe_user_table(schema: str, table: str) -> str:
     """
     try:
         sch = _safe_schema(schema)
-        tbl = _safe_ident(table, what="table")
-
         if sch not in _ALLOWED_SCHEMAS:
             return f"ERROR: Schema {sch} is not in allowed schemas."
 
+        tbl = _safe_ident(table, what="table")
+
         if sch in _USER_SCHEMAS:
             print(f"[USER_SCHEMA_ACCESS] Describe table: {sch}.{tbl}", file=sys.stderr)
 
-        return run_select(SYSCOLUMNS_FOR_TABLE_SQL, parameters=[sch, tbl, 5000])
+        return run_select(_with_limit(SYSCOLUMNS_FOR_TABLE_SQL, 5000), parameters=[sch, tbl])
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
         return f"ERROR: {type(e).__name__}: {e}"
 
 
-@tool(name="count-user-table-rows", description="Count rows in a user table (fast metadata query).")
-def count_user_table_rows(schema: str, table: str) -> str:
+
+@functools.lru_cache(maxsize=128)
+def _table_row_stats(sch: str, tbl: str, minute: int) -> str:
+    """SYSTABLESTAT row counts, memoized per clock minute. Errors raise so they are not cached."""
+    result = run_select(TABLE_ROW_STATS_SQL, parameters=[sch, tbl])
+    if result.startswith("ERROR"):
+        raise RuntimeError(result)
+    return result
+
+
+@tool(name="count-user-table-rows", description="Count rows in a user table (fast metadata query; exact=True runs COUNT(*)).")
+def count_user_table_rows(schema: str, table: str, exact: bool = False) -> str:
     """
     Returns row count for a table using metadata.
-    Fast operation that doesn't scan the table.
+    Fast operation that doesn't scan the table; the statistics can lag
+    behind recent bulk changes. exact=True counts the rows instead
+    (uncommitted read, so it takes no row locks).
     """
     try:
         sch = _safe_schema(schema)
-        tbl = _safe_ident(table, what="table")
-
         if sch not in _ALLOWED_SCHEMAS:
             return f"ERROR: Schema {sch} is not in allowed schemas."
 
+        tbl = _safe_ident(table, what="table")
+
         if sch in _USER_SCHEMAS:
             print(f"[USER_SCHEMA_ACCESS] Count rows: {sch}.{tbl}", file=sys.stderr)
 
-        sql = "SELECT NUMBER_ROWS, NUMBER_DELETED_ROWS, DATA_SIZE FROM QSYS2.SYSTABLESTAT WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?"
-        return run_select(sql, parameters=[sch, tbl])
+        if exact:
+            return run_select(f"SELECT COUNT(*) AS ROW_COUNT FROM {sch}.{tbl} OPTIMIZE FOR 1 ROW WITH UR")
+        try:
+            return _table_row_stats(sch, tbl, int(_time.time() // 60))
+        except RuntimeError as e:
+            return str(e)
     except ValueError as e:
         return f"ERROR: {e}"
     except Exception as e:
@@ -1930,157 +2894,191 @@ def count_user_table_rows(schema: str, table: str) -> str:
 # SINGLE SUPER AGENT
 # =============================================================================
 
-def build_super_agent() -> Agent:
-    model_id = os.getenv("OPENROUTER_MODEL_ID", "google/gemini-3-flash-preview")
+# Built once at import; build_super_agent() may be called per request by wrappers.
+ALL_TOOLS: Tuple[Any, ...] = (
+    # Ops / Observability
+    get_system_status, get_system_activity, get_system_snapshot, performance_triage_bundle,
+    top_cpu_jobs, jobs_in_msgw, qsysopr_messages,
+    netstat_snapshot, get_asp_info, disk_hotspots, output_queue_hotspots,
+    ended_jobs, job_queue_entries, user_storage_top, ifs_largest_objects,
+    objects_changed_recently,
+
+    # PTF / inventory / licensing
+    ptfs_requiring_ipl, software_products, license_info,
+
+    # Services discovery
+    search_sql_services,
+
+    # Security
+    list_user_profiles, list_privileged_profiles, public_all_object_authority,
+    object_privileges, authorization_lists, authorization_list_entries,
 
-    all_tools = [
-        # Ops / Observability
-        get_system_status, get_system_activity, top_cpu_jobs, jobs_in_msgw, qsysopr_messages,
-        netstat_snapshot, get_asp_info, disk_hotspots, output_queue_hotspots,
-        ended_jobs, job_queue_entries, user_storage_top, ifs_largest_objects,
-        objects_changed_recently,
+    # SQL Performance
+    plan_cache_top, plan_cache_errors, index_advice,
+    schema_table_stats, table_index_stats, lock_waits,
 
-        # PTF / inventory / licensing
-        ptfs_requiring_ipl, software_products, license_info,
+    # HA/DR / Journaling
+    journals, journal_receivers,
 
-        # Services discovery
-        search_sql_services,
+    # Integration (HTTP)
+    http_get_verbose, http_post_verbose, http_patch_verbose, http_delete_verbose,
 
-        # Security
-        list_user_profiles, list_privileged_profiles, public_all_object_authority,
-        object_privileges, authorization_lists, authorization_list_entries,
+    # Library sizing
+    largest_objects, library_sizes,
 
-        # SQL Performance
-        plan_cache_top, plan_cache_errors, index_advice,
-        schema_table_stats, table_index_stats, lock_waits,
+    # Metadata
+    list_tables_in_schema, describe_table, list_routines_in_schema,
 
-        # HA/DR / Journaling
-        journals, journal_receivers,
+    # Optional write logging
+    log_performance_metrics,
 
-        # Integration (HTTP)
-        http_get_verbose, http_post_verbose, http_patch_verbose, http_delete_verbose,
+    # Templates
+    generate_runbook, generate_checklist,
 
-        # Library sizing
-        largest_objects, library_sizes,
+    # IBM i 7.5 NEW Tools
+    security_info, db_transaction_info, active_jobs_detailed, netstat_job_info,
+    joblog_info, spooled_file_info, ifs_object_stats, ifs_object_locks,
+    system_values, library_list_info, hardware_resource_info,
 
-        # Metadata
-        list_tables_in_schema, describe_table, list_routines_in_schema,
+    # IBM i 7.6 Services (NEW)
+    ifs_authority_collection, verify_name, lookup_sqlstate,
+    dump_plan_cache_qro, certificate_usage_info, user_mfa_settings,
+    subsystem_routing_info, active_jobs_full, disk_block_size_info,
+    subsystem_pool_info, ptf_supersession,
 
-        # Optional write logging
-        log_performance_metrics,
+    # Program Source Analysis (NEW)
+    get_program_source_info, read_source_member,
+    analyze_program_dependencies,
 
-        # Templates
-        generate_runbook, generate_checklist,
+    # User Data Access (NEW)
+    query_user_table, describe_user_table, count_user_table_rows,
+)
 
-        # IBM i 7.5 NEW Tools
-        security_info, db_transaction_info, active_jobs_detailed, netstat_job_info,
-        joblog_info, spooled_file_info, ifs_object_stats, ifs_object_locks,
-        system_values, library_list_info, hardware_resource_info,
+SUPER_INSTRUCTIONS = dedent("""
+    You are an expert IBM i Super Assistant (IBM i 7.6 Edition).
+
+    Core rules:
+    - Use ONLY the provided tools to fetch IBM i system data.
+    - Do NOT ask the user to run SQL manually.
+    - For system data questions, call tools and cite results as evidence.
+    - If a tool returns an ERROR (missing service, permissions, etc.):
+      explain it clearly and propose alternatives (e.g., search-sql-services).
+
+    IBM i 7.5 Enhanced Tools:
+    - security-info: System-wide security configuration
+    - db-transaction-info: Active transactions and deadlock detection
+    - active-jobs-detailed: Jobs with SQL text and QRO hash
+    - netstat-job-info: Network connections with owning jobs
+    - joblog-info: Read job log messages
+    - spooled-file-info: Spool file (print) monitoring
+    - ifs-object-stats: IFS storage analysis
+    - ifs-object-locks: IFS file lock diagnostics
+    - system-values: Query system values
+    - library-list-info: Current library list
+    - hardware-resource-info: Hardware inventory
+    - http-patch-verbose, http-delete-verbose: Extended HTTP methods
+
+    IBM i 7.6 Enhancements:
+    - ifs-authority-collection: IFS authority analysis
+    - verify-name: Name validation
+    - lookup-sqlstate: SQLSTATE lookup
+    - dump-plan-cache-qro: Enhanced plan cache
+    - certificate-usage-info: Certificate tracking
+    - user-mfa-settings: MFA settings
+    - subsystem-routing-info: Subsystem routing
+
+    User Schema Access (Business Data):
+    - If ALLOWED_USER_SCHEMAS is configured, you can query user business data
+    - Use: query-user-table, describe-user-table, count-user-table-rows
+    - Examples: "top 3 orders from yesterday", "customers by revenue"
+    - All user schema queries are logged for audit purposes
+
+    Program Source Code:
+    - Use get-program-source-info to find where source code lives
+    - Use read-source-member to read actual source code
+    - Use analyze-program-dependencies to see what a program calls
+
+    Default mode:
+    - Read-only analysis and recommendations.
+    - Provide operationally safe guidance (plans/checklists/runbooks), not destructive execution.
+
+    How to choose tools (examples):
+    - Performance/CPU slowness: performance-triage-bundle (one call), get-system-snapshot (status + activity), get-system-status, get-system-activity, top-cpu-jobs, lock-waits, plan-cache-top, dump-plan-cache-qro
+    - Jobs stuck/hangs: jobs-in-msgw, qsysopr-messages, ended-jobs
+    - Disk growth/space: get-asp-info, disk-hotspots, output-queue-hotspots, library-sizes, largest-objects, ifs-largest-objects
+    - PTF/IPL readiness: ptfs-requiring-ipl, software-products, license-info
+    - Security posture: list-privileged-profiles, public-all-object-authority, object-privileges, authorization-lists, user-mfa-settings
+    - Db2 SQL tuning: plan-cache-top, plan-cache-errors, index-advice, schema-table-stats, table-index-stats
+    - Journaling/HA/DR: journals, journal-receivers, generate-runbook
+    - REST integration: http-get-verbose, http-post-verbose
+    - Metadata discovery: list-tables-in-schema, describe-table, list-routines-in-schema
+    - IFS security: ifs-authority-collection
+    - Program analysis: get-program-source-info, read-source-member, analyze-program-dependencies
+    - Business data: query-user-table, describe-user-table, count-user-table-rows
+    - Name validation: verify-name
+    - Error diagnosis: lookup-sqlstate
+
+    Output format (always):
+    - Summary
+    - Evidence (tool outputs)
+    - Interpretation
+    - Next Actions (safe, ordered steps)
+    """).strip()
 
-        # IBM i 7.6 Services (NEW)
-        ifs_authority_collection, verify_name, lookup_sqlstate,
-        dump_plan_cache_qro, certificate_usage_info, user_mfa_settings,
-        subsystem_routing_info, active_jobs_full, disk_block_size_info,
-        subsystem_pool_info, ptf_supersession,
 
-        # Program Source Analysis (NEW)
-        get_program_source_info, read_source_member,
-        analyze_program_dependencies,
+def build_super_agent() -> Agent:
+    model_id = os.getenv("OPENROUTER_MODEL_ID", "google/gemini-3-flash-preview")
 
-        # User Data Access (NEW)
-        query_user_table, describe_user_table, count_user_table_rows,
-    ]
+    # SUPER_INSTRUCTIONS and ALL_TOOLS are identical on every turn, so the
+    # prompt prefix is cacheable. Gemini and OpenAI models cache it implicitly;
+    # Anthropic models on OpenRouter need an explicit cache_control (opt-in).
+    model_kwargs: Dict[str, Any] = {}
+    if os.getenv("OPENROUTER_PROMPT_CACHE", "").strip().lower() in {"1", "true", "yes", "y"}:
+        model_kwargs["extra_body"] = {"cache_control": {"type": "ephemeral"}}
 
     return Agent(
         name="IBM i Super Assistant (7.6 Edition)",
-        model=OpenRouter(id=model_id),
-        tools=all_tools,
-        instructions=dedent("""
-        You are an expert IBM i Super Assistant (IBM i 7.6 Edition).
-
-        Core rules:
-        - Use ONLY the provided tools to fetch IBM i system data.
-        - Do NOT ask the user to run SQL manually.
-        - For system data questions, call tools and cite results as evidence.
-        - If a tool returns an ERROR (missing service, permissions, etc.):
-          explain it clearly and propose alternatives (e.g., search-sql-services).
-
-        IBM i 7.5 Enhanced Tools:
-        - security-info: System-wide security configuration
-        - db-transaction-info: Active transactions and deadlock detection
-        - active-jobs-detailed: Jobs with SQL text and QRO hash
-        - netstat-job-info: Network connections with owning jobs
-        - joblog-info: Read job log messages
-        - spooled-file-info: Spool file (print) monitoring
-        - ifs-object-stats: IFS storage analysis
-        - ifs-object-locks: IFS file lock diagnostics
-        - system-values: Query system values
-        - library-list-info: Current library list
-        - hardware-resource-info: Hardware inventory
-        - http-patch-verbose, http-delete-verbose: Extended HTTP methods
-
-        IBM i 7.6 Enhancements:
-        - ifs-authority-collection: IFS authority analysis
-        - verify-name: Name validation
-        - lookup-sqlstate: SQLSTATE lookup
-        - dump-plan-cache-qro: Enhanced plan cache
-        - certificate-usage-info: Certificate tracking
-        - user-mfa-settings: MFA settings
-        - subsystem-routing-info: Subsystem routing
-
-        User Schema Access (Business Data):
-        - If ALLOWED_USER_SCHEMAS is configured, you can query user business data
-        - Use: query-user-table, describe-user-table, count-user-table-rows
-        - Examples: "top 3 orders from yesterday", "customers by revenue"
-        - All user schema queries are logged for audit purposes
-
-        Program Source Code:
-        - Use get-program-source-info to find where source code lives
-        - Use read-source-member to read actual source code
-        - Use analyze-program-dependencies to see what a program calls
-
-        Default mode:
-        - Read-only analysis and recommendations.
-        - Provide operationally safe guidance (plans/checklists/runbooks), not destructive execution.
-
-        How to choose tools (examples):
-        - Performance/CPU slowness: get-system-status, get-system-activity, top-cpu-jobs, lock-waits, plan-cache-top, dump-plan-cache-qro
-        - Jobs stuck/hangs: jobs-in-msgw, qsysopr-messages, ended-jobs
-        - Disk growth/space: get-asp-info, disk-hotspots, output-queue-hotspots, library-sizes, largest-objects, ifs-largest-objects
-        - PTF/IPL readiness: ptfs-requiring-ipl, software-products, license-info
-        - Security posture: list-privileged-profiles, public-all-object-authority, object-privileges, authorization-lists, user-mfa-settings
-        - Db2 SQL tuning: plan-cache-top, plan-cache-errors, index-advice, schema-table-stats, table-index-stats
-        - Journaling/HA/DR: journals, journal-receivers, generate-runbook
-        - REST integration: http-get-verbose, http-post-verbose
-        - Metadata discovery: list-tables-in-schema, describe-table, list-routines-in-schema
-        - IFS security: ifs-authority-collection
-        - Program analysis: get-program-source-info, read-source-member, analyze-program-dependencies
-        - Business data: query-user-table, describe-user-table, count-user-table-rows
-        - Name validation: verify-name
-        - Error diagnosis: lookup-sqlstate
-
-        Output format (always):
-        - Summary
-        - Evidence (tool outputs)
-        - Interpretation
-        - Next Actions (safe, ordered steps)
-        """).strip(),
+        model=OpenRouter(id=model_id, **model_kwargs),
+        tools=list(ALL_TOOLS),
+        instructions=SUPER_INSTRUCTIONS,
         markdown=True,
     )
 
-
 # =============================================================================
 # MAIN LOOP
 # =============================================================================
 
+# Pooled connections signed on while the user types the first question
+_WARM_CONNECTIONS = 2
+
+
+def _warm_up() -> None:
+    """
+    Background start-up work that would otherwise land on the first question:
+    sign on a couple of pooled connections (parallel tools need more than one)
+    and prime the system status cache, and Db2's plan cache with it.
+    """
+    try:
+        conns = [_get_pooled_connection() for _ in range(min(_WARM_CONNECTIONS, _MAX_POOL_SIZE))]
+        for conn in conns:
+            _return_connection_to_pool(conn)
+        _snapshot_select("system_status", SYSTEM_STATUS_SQL)
+    except Exception as e:
+        print(f"[WARMUP] Skipped: {type(e).__name__}: {e}", file=sys.stderr)
+
+
 def main() -> None:
     _ = get_ibmi_credentials()
     _ = _require_env("OPENROUTER_API_KEY")
 
     # Preload available IBM i services for faster tool execution
     service_count = preload_services()
+    if not service_count:
+        # Full snapshot unavailable; at least resolve the services the tools check
+        service_count = warm_required_services()
 
     agent = build_super_agent()
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
 
     print(f"\n✅ IBM i Super Agent is ready (IBM i 7.6 Edition - {len(agent.tools)} tools, {service_count} services detected).")
     print("Try questions like:")